@@ -1,5 +1,20 @@
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, ToolMessage
 from app.agent.config.config import get_agent
+from app.agent.config.tools import (
+    jobs,
+    journal,
+    kernels,
+    notify_file_change,
+    processes,
+    read_tracker,
+    workspaces,
+)
+from app.agent.config.router import estimated_savings
+from app.agent.config.hedging import hedging_summary
+from app.utils.metrics import metrics
+from app.utils.checkpointer import DeltaCheckpointSaver
+from app.utils.processes import kill_on_interrupt
+from app.utils.turn_budget import TurnBudget
 from app.utils.ascii_art import ASCII_ART
 from rich.console import Console
 from app.agent.ui import AgentUI
@@ -12,17 +27,34 @@ import os
 
 class Agent:
 
-    def __init__(self, model_name, api_key, system_prompt=None):
+    def __init__(self, model_name, api_key, system_prompt=None, **agent_options):
         self.model_name = model_name
         self.api_key = api_key
         self.system_prompt = system_prompt
-        self.agent = get_agent(
-            model_name=model_name, api_key=api_key, system_prompt=system_prompt
-        )
+        # forwarded to get_agent on every (re)build, e.g. tool_output_budget
+        self.agent_options = agent_options
+        # shared by every rebuild, so /model keeps the conversation
+        self.checkpointer = DeltaCheckpointSaver()
+        self.agent = self.build_agent()
         self.console = Console()
         self.ui = AgentUI(self.console)
 
-    def start_chat(self, recursion_limit: int = 100):
+    def build_agent(self):
+        """(Re)build the graph; the workspace briefing in the system prompt is rebuilt with it."""
+        return get_agent(
+            model_name=self.model_name,
+            api_key=self.api_key,
+            system_prompt=self.system_prompt,
+            checkpointer=self.checkpointer,
+            **self.agent_options,
+        )
+
+    def start_chat(
+        self,
+        recursion_limit: int = 100,
+        max_turn_seconds: float = 600,
+        max_turn_tokens: int = 250_000,
+    ):
 
         self.ui.logo(ASCII_ART)
         self.ui.help(self.model_name)
@@ -32,32 +64,35 @@ class Agent:
             "recursion_limit": recursion_limit,
         }
 
-        continue_flag = False
+        # the step limit is only a backstop, turns are bounded by time and tokens
+        budget = TurnBudget(max_seconds=max_turn_seconds, max_tokens=max_turn_tokens)
 
         while True:
+            step_running = False
             try:
 
-                if continue_flag:
-                    user_input = (
-                        "Continue where you left. Don't repeat anything already done."
-                    )
-                    self.console.print(
-                        f"\n[bold blue]You[/bold blue]: {user_input}",
-                        style="blue",
-                    )
-                    continue_flag = False
-                else:
-                    user_input = Prompt.ask(
-                        "\n[bold blue]You[/bold blue]", console=self.console
-                    ).strip()
+                user_input = Prompt.ask(
+                    "\n[bold blue]You[/bold blue]", console=self.console
+                ).strip()
 
                 if user_input.lower() in ["/quit", "/exit", "/q"]:
                     self.ui.goodbye()
                     break
 
                 if user_input.lower() == "/clear":
+                    workspace = workspaces.get(configuration)
+                    if any(workspace.changes().values()):
+                        # the overlay belongs to the thread, a new one could not reach it
+                        self.ui.error("Unmerged workspace changes: type /merge or /discard first.")
+                        continue
+                    workspaces.discard(configuration["configurable"]["thread_id"])
                     # new session
+                    read_tracker.forget_thread(configuration["configurable"]["thread_id"])
+                    kernels.shutdown(configuration["configurable"]["thread_id"])
+                    self.checkpointer.delete_thread(configuration["configurable"]["thread_id"])
                     configuration["configurable"]["thread_id"] = str(uuid.uuid4())
+                    # the new session starts with a fresh workspace briefing
+                    self.agent = self.build_agent()
                     self.ui.history_cleared()
                     continue
 
@@ -69,11 +104,70 @@ class Agent:
                     self.ui.help(self.model_name)
                     continue
 
+                if user_input.lower() in ["/continue", "/c"]:
+                    if not self.agent.get_state(configuration).next:
+                        self.ui.error("Nothing to continue.")
+                        continue
+                    step_running = True
+                    budget.start()
+                    self.run_turn(None, configuration, budget)
+                    continue
+
                 if not user_input:
                     continue
 
                 command_parts = user_input.lower().split(" ")
 
+                if command_parts[0] == "/stats":
+                    for name, value in self.checkpointer.memory_stats().items():
+                        metrics.set(f"checkpoints.{name}", value)
+                    self.ui.stats(metrics.snapshot(), estimated_savings(), hedging_summary())
+                    continue
+
+                if command_parts[0] == "/snapshots":
+                    self.ui.snapshots(journal.snapshots())
+                    continue
+
+                if command_parts[0] in ["/undo", "/restore"]:
+                    if command_parts[0] == "/undo":
+                        restored = journal.undo()
+                    elif len(command_parts) < 2 or not command_parts[1].isdigit():
+                        self.ui.error("Please specify a snapshot number. Type /snapshots to list them.")
+                        continue
+                    else:
+                        restored = journal.restore(int(command_parts[1]))
+
+                    for path in restored:
+                        notify_file_change(path)
+                    self.ui.files_restored(restored)
+                    continue
+
+                if command_parts[0] in ["/changes", "/workspace"]:
+                    workspace = workspaces.get(configuration)
+                    self.ui.workspace_changes(workspace.changes(), workspace.overlay)
+                    continue
+
+                if command_parts[0] == "/merge":
+                    workspace = workspaces.get(configuration)
+                    merged, conflicts = workspace.merge(force="force" in command_parts[1:])
+                    for rel in merged:
+                        notify_file_change(os.path.join(workspace.base, rel))
+                    self.ui.workspace_merged(merged, conflicts)
+                    continue
+
+                if command_parts[0] == "/discard":
+                    workspace = workspaces.get(configuration)
+                    if workspace.overlay is None:
+                        self.ui.workspace_changes({}, None)
+                        continue
+                    thread_id = configuration["configurable"]["thread_id"]
+                    changes = workspace.changes()
+                    # the kernel's cwd is the overlay, it goes with it
+                    kernels.shutdown(thread_id)
+                    workspaces.discard(thread_id)
+                    self.ui.workspace_discarded(changes)
+                    continue
+
                 if command_parts[0] == "/model":
                     if len(command_parts) == 1:
                         self.ui.status_message(
@@ -93,11 +187,7 @@ class Agent:
                             message=f"Changing model to {new_model}",
                         )
                         self.model_name = new_model
-                        self.agent = get_agent(
-                            model_name=self.model_name,
-                            api_key=self.api_key,
-                            system_prompt=self.system_prompt,
-                        )
+                        self.agent = self.build_agent()
                         continue
 
                     self.ui.error("Unknown model command. Type /help for instructions.")
@@ -107,44 +197,29 @@ class Agent:
                     self.ui.error("Unknown command. Type /help for instructions.")
                     continue
 
+                # a paused turn is abandoned once the user gives new instructions
+                self.close_pending_tool_calls(
+                    configuration, "Skipped: the user sent new instructions before this ran."
+                )
+
+                journal.begin_snapshot(user_input)
+                step_running = True
                 self.ui.simulate_thinking()
 
-                # start response streaming
-                for chunk in self.agent.stream(
-                    {"messages": [("human", user_input)]}, configuration
-                ):
-
-                    if "llm" in chunk:
-                        llm_data = chunk["llm"]
-                        if "messages" in llm_data:
-                            messages = llm_data["messages"]
-                            if messages and isinstance(messages[0], AIMessage):
-                                ai_message = messages[0]
-
-                                if ai_message.tool_calls:
-                                    for tool_call in ai_message.tool_calls:
-                                        self.ui.tool_call(
-                                            tool_call["name"], tool_call["args"]
-                                        )
-
-                                if ai_message.content and ai_message.content.strip():
-                                    self.ui.ai_response(ai_message.content)
-
-                    elif "tools" in chunk:
-                        tools_data = chunk["tools"]
-                        if "messages" in tools_data:
-                            for tool_message in tools_data["messages"]:
-                                self.ui.tool_output(
-                                    tool_message.name, tool_message.content
-                                )
+                budget.start()
+                self.run_turn({"messages": [("human", user_input)]}, configuration, budget)
 
             except KeyboardInterrupt:
+                if step_running:
+                    # first Ctrl-C only cancels the running step, the next one exits
+                    try:
+                        self.cancel_step(configuration)
+                        continue
+                    except KeyboardInterrupt:
+                        pass
                 self.ui.session_interrupted()
                 self.ui.goodbye()
                 break
-            except langgraph.errors.GraphRecursionError as e:
-                self.ui.recursion_warning()
-                continue_flag = True
             except openai.RateLimitError:
                 self.ui.status_message(
                     "⏳",
@@ -155,3 +230,105 @@ class Agent:
             except Exception as e:
                 self.ui.error(str(e))
                 self.ui.dev_traceback()  # dev (remove later)
+
+        # background jobs and kernels do not outlive the session
+        jobs.kill_all()
+        kernels.shutdown_all()
+        # overlays without changes go too; the others are kept for the user to inspect
+        kept = workspaces.cleanup()
+        if kept:
+            self.ui.overlays_kept(kept)
+
+    def run_turn(self, graph_input, configuration: dict, budget: TurnBudget):
+        """Run a turn to completion, resuming from the checkpoint on step-limit hits."""
+        while True:
+            try:
+                finished = self.stream_response(graph_input, configuration, budget)
+            except langgraph.errors.GraphRecursionError:
+                # the pending step is still in the checkpoint: pick it up with a fresh step count
+                self.ui.recursion_warning(budget.progress())
+                graph_input = None
+                continue
+
+            if not finished:
+                self.ui.turn_paused(budget.exhausted(), budget.progress())
+            return
+
+    def stream_response(self, graph_input, configuration: dict, budget: TurnBudget) -> bool:
+        """Run the graph and render its llm and tool updates as they arrive.
+
+        Returns False when the turn budget ran out and the run was stopped at
+        the last completed step. The budget is only checked before another
+        step starts, so a turn that ends on its last step is never paused.
+        """
+        # a running kernel cell is interrupted rather than killed, keeping its state
+        with kill_on_interrupt(processes, kernels.interrupt_all):
+            for chunk in self.agent.stream(graph_input, configuration):
+                another_step = True
+
+                if "llm" in chunk:
+                    llm_data = chunk["llm"]
+                    if "messages" in llm_data:
+                        messages = llm_data["messages"]
+                        if messages and isinstance(messages[0], AIMessage):
+                            ai_message = messages[0]
+                            budget.record_llm(ai_message)
+                            another_step = bool(
+                                ai_message.tool_calls or ai_message.invalid_tool_calls
+                            )
+
+                            if ai_message.tool_calls:
+                                for tool_call in ai_message.tool_calls:
+                                    self.ui.tool_call(
+                                        tool_call["name"], tool_call["args"]
+                                    )
+
+                            if ai_message.content and ai_message.content.strip():
+                                self.ui.ai_response(ai_message.content)
+
+                elif "tools" in chunk:
+                    tools_data = chunk["tools"]
+                    if "messages" in tools_data:
+                        for tool_message in tools_data["messages"]:
+                            self.ui.tool_output(
+                                tool_message.name, tool_message.content
+                            )
+                        budget.record_tools(len(tools_data["messages"]))
+                        self.ui.turn_progress(budget.progress())
+
+                elif "loop_guard" in chunk:
+                    self.ui.loop_stopped(chunk["loop_guard"]["messages"][0].content)
+                    another_step = False
+
+                if another_step and budget.exhausted():
+                    return False
+        return True
+
+    def cancel_step(self, configuration: dict):
+        """Abort the in-flight step and leave the thread at its last checkpoint."""
+        killed = processes.kill_all()
+        # the interrupted step was never checkpointed, but a finished llm step may
+        # have left tool calls without results, which the next request would reject
+        self.close_pending_tool_calls(
+            configuration, "Cancelled by the user before it completed."
+        )
+        self.ui.step_cancelled(killed)
+
+    def close_pending_tool_calls(self, configuration: dict, reason: str):
+        """Answer tool calls left without results so the thread stays valid."""
+        messages = self.agent.get_state(configuration).values.get("messages", [])
+        if messages and isinstance(messages[-1], AIMessage) and messages[-1].tool_calls:
+            self.agent.update_state(
+                configuration,
+                {
+                    "messages": [
+                        ToolMessage(
+                            tool_call_id=tool_call["id"],
+                            name=tool_call["name"],
+                            content=reason,
+                        )
+                        for tool_call in messages[-1].tool_calls
+                    ]
+                },
+                as_node="tools",
+            )
@@ -0,0 +1,145 @@
+import os
+import threading
+import httpx
+from langchain_cerebras import ChatCerebras
+
+
+class Backend:
+    """A model provider: how to build its chat model and how to talk to it."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "openai",
+        base_url: str | None = None,
+        api_key_env: str | None = None,
+        requires_key: bool = True,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 300.0,
+        max_connections: int = 20,
+        max_retries: int = 5,
+    ):
+        self.name = name
+        self.kind = kind  # "cerebras" or "openai" (any OpenAI-compatible endpoint)
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+        self.requires_key = requires_key  # local servers usually ignore the key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+class BackendRegistry:
+    """Selects a backend per model name and owns one pooled HTTP client per backend.
+
+    Model names may carry a backend prefix, e.g. ``local:qwen2.5-coder``;
+    names without a registered prefix go to the default backend. Clients are
+    created once and shared by every graph rebuild and session, so keep-alive
+    connections (and their TLS handshakes) are reused across turns.
+    """
+
+    def __init__(self, default: str = "cerebras"):
+        self.default = default
+        self._backends = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register(self, backend: Backend):
+        with self._lock:
+            self._backends[backend.name] = backend
+            stale = self._clients.pop(backend.name, None)
+        if stale is not None:
+            stale.close()
+
+    def register_openai_compatible(self, name: str, base_url: str, **options) -> Backend:
+        """Register any OpenAI-compatible endpoint (vLLM, llama.cpp server, ...)."""
+        backend = Backend(name, kind="openai", base_url=base_url, **options)
+        self.register(backend)
+        return backend
+
+    def resolve(self, model_name: str) -> tuple:
+        """Return (backend, provider model name) for a possibly prefixed model name."""
+        prefix, sep, rest = model_name.partition(":")
+        if sep and prefix in self._backends:
+            return self._backends[prefix], rest
+        return self._backends[self.default], model_name
+
+    def http_client(self, backend: Backend) -> httpx.Client:
+        with self._lock:
+            client = self._clients.get(backend.name)
+            if client is None:
+                client = httpx.Client(
+                    timeout=backend.timeout,
+                    limits=httpx.Limits(
+                        max_connections=backend.max_connections,
+                        max_keepalive_connections=backend.max_connections,
+                        keepalive_expiry=120,
+                    ),
+                )
+                self._clients[backend.name] = client
+            return client
+
+    def create_llm(self, model_name: str, api_key: str | None = None, **model_kwargs):
+        """Build the chat model for model_name on its backend's shared client.
+
+        The caller's api_key is the default (Cerebras) backend's key and is only
+        ever sent there; every other backend uses its own ``api_key_env``.
+        """
+        backend, model = self.resolve(model_name)
+        if backend.name != self.default:
+            api_key = os.getenv(backend.api_key_env) if backend.api_key_env else None
+            if not api_key and backend.requires_key:
+                raise ValueError(
+                    f"Backend '{backend.name}' needs an API key: set {backend.api_key_env}"
+                )
+        elif backend.api_key_env and os.getenv(backend.api_key_env):
+            api_key = os.getenv(backend.api_key_env)
+
+        common = dict(
+            model=model,
+            timeout=backend.timeout,
+            max_retries=backend.max_retries,
+            http_client=self.http_client(backend),
+            stream_usage=True,
+            **model_kwargs,
+        )
+        if backend.kind == "cerebras":
+            return ChatCerebras(api_key=api_key, **common)
+
+        try:
+            from langchain_openai import ChatOpenAI
+        except ImportError as e:
+            raise ImportError(
+                f"Backend '{backend.name}' needs langchain-openai: pip install langchain-openai"
+            ) from e
+        # a backend that does not need a key still gets one, the client insists
+        return ChatOpenAI(base_url=backend.base_url, api_key=api_key or "not-needed", **common)
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
+
+
+backends = BackendRegistry()
+backends.register(Backend("cerebras", kind="cerebras"))
+backends.register_openai_compatible(
+    "local",
+    os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1"),
+    api_key_env="LOCAL_LLM_API_KEY",
+    requires_key=False,
+    connect_timeout=2.0,
+    read_timeout=600.0,
+    max_retries=1,
+)
+backends.register_openai_compatible(
+    "openai",
+    os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    api_key_env="OPENAI_API_KEY",
+)
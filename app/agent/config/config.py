@@ -1,24 +1,68 @@
-from langchain_cerebras import ChatCerebras
 from langgraph.graph.state import CompiledStateGraph
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    message_chunk_to_message,
+)
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END, START
 from typing import TypedDict, Annotated
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.prompts import ChatPromptTemplate
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableConfig
+from app.utils.spill_store import ToolResultPolicy, estimate_tokens
+from app.utils.relevance_index import RelevanceIndex
+from app.utils.briefing import WorkspaceBriefing
+from app.utils.speculation import SpeculativeExecutor
+from app.utils.tool_ledger import ToolCallLedger
+from app.utils.metrics import metrics
+from app.utils.checkpointer import DeltaCheckpointSaver
+from app.agent.config.backends import backends
+from app.agent.config.router import MALFORMED_TOOL_CALL, ModelRouter, is_tool_error
+from app.agent.config.hedging import RequestHedger
 from app.agent.config.tools import (
+    READ_ONLY_TOOLS,
+    compact_tool,
+    read_tracker,
+    spill_store,
+    workspaces,
+    jobs,
+    on_file_change,
     create_wd,
     create_file,
     modify_file,
     delete_file,
     read_file,
+    read_many_files,
+    outline_file,
+    read_symbol,
+    replace_symbol,
     list_directory,
     execute_command,
     execute_code,
+    run_cell,
+    restart_kernel,
+    profile_code,
+    run_tests,
     # stall,
     append_file,
     delete_directory,
+    fetch_output,
+    start_job,
+    job_status,
+    job_tail,
+    job_wait,
+    kill_job,
+    tool_help,
 )
 
 
@@ -26,20 +70,55 @@ class State(TypedDict):
     messages: Annotated[list, add_messages]
 
 
+# one per workspace tree, so an isolated thread's unmerged edits only reach its own
+# context; shared across graph rebuilds so a model switch keeps the warm indexes
+relevance_indexes = {}
+_relevance_lock = threading.Lock()
+
+
+def relevance_index_for(root: str) -> RelevanceIndex:
+    with _relevance_lock:
+        for stale in [r for r in relevance_indexes if not os.path.isdir(r)]:
+            del relevance_indexes[stale]  # a discarded overlay
+        if root not in relevance_indexes:
+            relevance_indexes[root] = RelevanceIndex(root)
+        return relevance_indexes[root]
+
+
+# also shared by every rebuild (/clear, /model): the learned latency percentiles and
+# the speculation threads
+request_hedger = RequestHedger()
+speculation_pool = ThreadPoolExecutor(4, thread_name_prefix="speculate")
+
+
+@on_file_change
+def _mark_relevance_dirty(path: str):
+    # each index ignores the paths outside its own tree
+    for index in list(relevance_indexes.values()):
+        index.mark_dirty(path)
+
+
 def get_agent(
     model_name: str,
     api_key: str,
     system_prompt: str | None = None,
+    tool_output_budget: int = 2000,
+    context_budget: int = 1500,
+    workspace_root: str | None = None,
+    speculative_tools: bool = True,
+    model_tiers: dict | None = None,
+    checkpointer: BaseCheckpointSaver | None = None,
+    compact_schemas: bool = True,
+    hedge_requests: bool = False,
+    hedge_model: str | None = None,
+    briefing_budget: int = 1500,
+    max_tool_repeats: int = 3,
+    isolated_workspace: bool = False,
 ) -> CompiledStateGraph:
     """Load configuration and initialize the code generator agent."""
 
-    llm = ChatCerebras(
-        model=model_name,
-        temperature=1.5,
-        timeout=None,
-        max_retries=5,
-        api_key=api_key,
-    )
+    # isolated: every thread edits and runs commands in its own overlay until /merge
+    workspaces.configure(workspace_root, isolated_workspace)
 
     tools = [
         create_wd,
@@ -47,46 +126,249 @@ def get_agent(
         modify_file,
         delete_file,
         read_file,
+        read_many_files,
+        outline_file,
+        read_symbol,
+        replace_symbol,
         list_directory,
         execute_command,
         execute_code,
+        run_cell,
+        restart_kernel,
+        profile_code,
+        run_tests,
         # stall,
         append_file,
         delete_directory,
+        fetch_output,
+        start_job,
+        job_status,
+        job_tail,
+        job_wait,
+        kill_job,
     ]
+    if compact_schemas:
+        # short schemas on every request, the long guides behind tool_help
+        tools = [compact_tool(t) for t in tools + [tool_help]]
 
+    # system prompt and tools form a byte-stable prefix the provider can cache;
+    # the history follows as real messages and only ever grows at the end
+    system_prompt = system_prompt or "You are a helpful assistant."
+    if isolated_workspace:
+        system_prompt += (
+            "\n\nYour file edits and commands run in a private copy of the workspace; the "
+            "user reviews and merges them. Keep using the workspace paths as usual."
+        )
+    if briefing_budget:
+        # built once per session so the prefix stays byte-stable until the next /clear
+        briefing = WorkspaceBriefing(workspace_root or os.getcwd(), briefing_budget).build()
+        metrics.set("prompt.briefing_tokens", estimate_tokens(briefing))
+        if briefing:
+            system_prompt += (
+                "\n\n## WORKSPACE BRIEFING\n"
+                "Snapshot taken at session start; re-read files before editing them.\n\n"
+                + briefing
+            )
+    system_message = SystemMessage(content=system_prompt)
     template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt or "You are a helpful assistant."),
-            ("human", "{messages}"),
-        ]
+        [system_message, MessagesPlaceholder("messages")]
     )
+    prefix = system_message.content + json.dumps([convert_to_openai_tool(t) for t in tools])
+    metrics.set("prompt.prefix_tokens", estimate_tokens(prefix))
+
+    chains = {}
+
+    def chain_for(model: str):
+        # pooled client and per-backend timeouts come from the registry
+        if model not in chains:
+            llm = backends.create_llm(model, api_key=api_key, temperature=1.5)
+            chains[model] = template | llm.bind_tools(tools=tools)
+        return chains[model]
+
+    # the selected model is always the strong tier; a fast tier is opt-in
+    tiers = {**(model_tiers or {}), "strong": model_name}
+    router = ModelRouter(tiers)
+    chain_for(model_name)
+    # slow-to-start requests get a duplicate, to hedge_model if set
+    hedger = request_hedger if hedge_requests else None
 
-    llm_with_tools = llm.bind_tools(tools=tools)
-    llm_chain = template | llm_with_tools
     graph = StateGraph(State)
 
     # preparing the nodes
-    def llm_node(state: State):
-        return {"messages": [llm_chain.invoke(state["messages"])]}
+    # thread id -> (id of the turn's human message, retrieved context); the context is
+    # only added to the prompts of that turn and never stored in the history
+    turn_context = {}
+
+    def context_node(state: State, config: RunnableConfig):
+        message = state["messages"][-1]
+        if not isinstance(message, HumanMessage):
+            return {}
+
+        thread_id = config["configurable"]["thread_id"]
+        read_tracker.begin_turn(thread_id)
+        ledger.begin_turn(thread_id)
+        turn_context.pop(thread_id, None)
+        if not context_budget:
+            return {}
+
+        index = relevance_index_for(workspaces.get(config).root)
+        context = index.context_for(message.content, budget_tokens=context_budget)
+        if context:
+            turn_context[thread_id] = (message.id, context)
+        return {}
+
+    def with_context(messages: list, thread_id: str) -> list:
+        """The history as sent to the model: the current turn's request carries its context."""
+        message_id, context = turn_context.get(thread_id, (None, None))
+        if context is None:
+            return messages
+        return [
+            HumanMessage(content=f"{context}\n\n{m.content}", id=m.id) if m.id == message_id else m
+            for m in messages
+        ]
+
+    speculator = SpeculativeExecutor(
+        tools, READ_ONLY_TOOLS if speculative_tools else set(), pool=speculation_pool
+    )
+
+    def llm_node(state: State, config: RunnableConfig):
+        thread_id = config["configurable"]["thread_id"]
+        speculator.begin(thread_id, config)
+        tier, reason = router.choose(state["messages"])
+        started = time.monotonic()
+        message = None
+        model = tiers[tier]
+        inputs = {"messages": with_context(state["messages"], thread_id)}
+        if hedger is None:
+            stream = chain_for(model).stream(inputs)
+        else:
+            backup = hedge_model or model
+            stream = hedger.stream(
+                model,
+                lambda: chain_for(model).stream(inputs),
+                backup,
+                lambda: chain_for(backup).stream(inputs),
+            )
+        # stream so read-only tool calls can start before the message is complete
+        for chunk in stream:
+            message = chunk if message is None else message + chunk
+            if message.tool_call_chunks:
+                speculator.observe(thread_id, message)
+
+        if message is None:
+            raise ValueError("The model returned an empty response.")
+        message = message_chunk_to_message(message)
+        speculator.finish(thread_id, message)
+        router.record(tier, reason, time.monotonic() - started)
+        metrics.incr("llm.steps")
+        record_prompt_cache(message)
+        return {"messages": [message]}
 
     tool_node = ToolNode(tools=tools)
+    tool_policy = ToolResultPolicy(spill_store, max_tokens=tool_output_budget)
+    # job status and logs change on their own, polling them is not a loop; a
+    # running job can also be what a failed command was waiting for
+    ledger = ToolCallLedger(
+        READ_ONLY_TOOLS,
+        max_tool_repeats,
+        polling={"job_status", "job_tail", "job_wait"},
+        busy=jobs.any_running,
+    )
+
+    def tools_node(state: State, config: RunnableConfig):
+        ai_message = state["messages"][-1]
+        thread_id = config["configurable"]["thread_id"]
+        # the ledger checks the files the tools really see in this thread's workspace
+        resolve = workspaces.get(config).resolve
+        results = {}
+        remaining = []
+        executed = set()
+        for tool_call in ai_message.tool_calls:
+            speculated = speculator.take(thread_id, tool_call["id"])
+            duplicate = ledger.lookup(thread_id, tool_call["name"], tool_call["args"], resolve)
+            if duplicate is not None:
+                metrics.incr("loops.duplicates")
+                results[tool_call["id"]] = ToolMessage(
+                    content=duplicate, name=tool_call["name"], tool_call_id=tool_call["id"]
+                )
+                continue
+            executed.add(tool_call["id"])
+            if speculated is not None:
+                results[tool_call["id"]] = speculated
+            else:
+                remaining.append(tool_call)
+
+        if remaining:
+            pending = ai_message.model_copy(update={"tool_calls": remaining})
+            for message in tool_node.invoke({"messages": [pending]}, config)["messages"]:
+                results[message.tool_call_id] = message
 
+        for tool_call in ai_message.tool_calls:
+            message = results.get(tool_call["id"])
+            if message is not None and tool_call["id"] in executed:
+                ledger.record(
+                    thread_id,
+                    tool_call["name"],
+                    tool_call["args"],
+                    str(message.content),
+                    is_tool_error(message),
+                    resolve,
+                )
+
+        messages = [results[c["id"]] for c in ai_message.tool_calls if c["id"] in results]
+        # oversized outputs are spilled before they reach the history
+        for message in messages:
+            content = tool_policy.apply(message.name, message.content)
+            # a read counts as seen only when its whole result makes it into the history
+            if message.artifact is not None and content == message.content:
+                read_tracker.commit(message.artifact)
+            message.content, message.artifact = content, None
+        return {"messages": messages}
+
+    def loop_detected(state: State, config: RunnableConfig):
+        return "loop_guard" if ledger.stopped(config["configurable"]["thread_id"]) else "llm"
+
+    def loop_guard_node(state: State, config: RunnableConfig):
+        # ends the turn instead of paying for more identical rounds
+        metrics.incr("loops.stopped")
+        diagnostic = ledger.stopped(config["configurable"]["thread_id"])
+        return {"messages": [AIMessage(content=diagnostic)]}
+
+    graph.add_node("context", context_node)
     graph.add_node("llm", llm_node)
-    graph.add_node("tools", tool_node)
-    graph.add_node("toolcall_checker", forward)
+    graph.add_node("tools", tools_node)
+    graph.add_node("toolcall_checker", check_toolcall)
+    graph.add_node("loop_guard", loop_guard_node)
 
-    graph.add_edge(START, "llm")
+    graph.add_edge(START, "context")
+    graph.add_edge("context", "llm")
     graph.add_conditional_edges(
         "llm", tool_call_attempted, {"toolcall_checker": "toolcall_checker", END: END}
     )
     graph.add_conditional_edges(
         "toolcall_checker", valid_toolcall, {"tools": "tools", "llm": "llm"}
     )
-    graph.add_edge("tools", "llm")
+    graph.add_conditional_edges(
+        "tools", loop_detected, {"llm": "llm", "loop_guard": "loop_guard"}
+    )
+    graph.add_edge("loop_guard", END)
+
+    # pass the same checkpointer on rebuilds to keep the conversation
+    return graph.compile(checkpointer=checkpointer or DeltaCheckpointSaver())
+
 
-    mem = MemorySaver()
-    return graph.compile(checkpointer=mem)
+def record_prompt_cache(message):
+    """Count input and cache-read tokens, as reported by the provider."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage or not usage.get("input_tokens"):
+        return
+    cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    metrics.incr("prompt.input_tokens", usage["input_tokens"])
+    metrics.incr("prompt.cached_tokens", cached)
+    metrics.set(
+        "prompt.cache_hit_rate",
+        metrics.count("prompt.cached_tokens") / metrics.count("prompt.input_tokens"),
+    )
 
 
 def tool_call_attempted(state: State):
@@ -110,29 +392,22 @@ def tool_call_attempted(state: State):
 def valid_toolcall(state: State):
 
     if state["messages"] != []:
-        ai_message = state["messages"][-1]
-        content = ai_message.content
-        tool_calls = ai_message.tool_calls
+        message = state["messages"][-1]
     else:
         raise ValueError(
             f"No messages found in input state to check for tool calls in."
         )
-    
-    if not tool_calls and any(
-        substr in content for substr in ("{", "}", "tool_call", "arguments", "<tool")
-    ):
-        error_message = ToolMessage(
-            tool_call_id="retry",
-            content="Error: Your tool call was malformed or non-JSON. Please fix and retry.",
-            invalid=True,
-        )
-
-        if "messages" not in state:
-            state["messages"] = []
-        state["messages"].append(error_message)
 
+    # the checker asked the model to retry a malformed call
+    if isinstance(message, HumanMessage):
         return "llm"
     else:
         return "tools"
-def forward(state: State):
-    return {}
\ No newline at end of file
+
+
+def check_toolcall(state: State):
+    ai_message = state["messages"][-1]
+    if ai_message.tool_calls:
+        return {}
+    # a user turn rather than a ToolMessage, which would answer no tool call
+    return {"messages": [HumanMessage(content=MALFORMED_TOOL_CALL)]}
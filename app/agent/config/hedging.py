@@ -0,0 +1,160 @@
+import queue
+import threading
+import time
+from collections import deque
+from app.utils.metrics import metrics
+
+_CHUNK, _END, _ERROR = "chunk", "end", "error"
+
+
+class _Attempt:
+    """One streaming request, drained into a shared queue by a daemon thread."""
+
+    def __init__(self, name: str, factory, events: queue.Queue, on_first_chunk=None):
+        self.name = name
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self._events = events
+        self._on_first_chunk = on_first_chunk
+        threading.Thread(target=self._run, args=(factory,), daemon=True).start()
+
+    def _run(self, factory):
+        try:
+            stream = factory()
+            try:
+                for index, chunk in enumerate(stream):
+                    # a blocked read cannot be interrupted, so even a cancelled
+                    # request reports when its first chunk would have arrived
+                    if index == 0 and self._on_first_chunk is not None:
+                        self._on_first_chunk(time.monotonic() - self.started)
+                    if self.cancelled.is_set():
+                        break
+                    self._events.put((self, _CHUNK, chunk))
+            finally:
+                # closing the generator closes the HTTP response of a cancelled request
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+            self._events.put((self, _END, None))
+        except BaseException as e:
+            self._events.put((self, _ERROR, e))
+
+
+class RequestHedger:
+    """Sends a duplicate of LLM requests that are slow to start and keeps the faster one.
+
+    A request that has not produced its first chunk after the
+    ``percentile`` of recent first-chunk latencies gets a hedge to the same
+    or a backup model; whichever streams first wins and the other is
+    cancelled. Hedges spend a budget that grows by ``max_rate`` per request
+    (at most ``burst``), so they stay within a fixed share of the provider's
+    rate limit. No hedging happens before ``min_samples`` latencies are known.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_samples: int = 10,
+        min_delay: float = 1.0,
+        max_rate: float = 0.1,
+        burst: float = 2.0,
+        window: int = 200,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._latencies = {}  # model -> recent first-chunk latencies of unhedged requests
+        self._window = window
+        self._budget = 1.0
+
+    def deadline(self, model: str) -> float | None:
+        """Seconds to wait for the first chunk before hedging, or None while learning."""
+        with self._lock:
+            values = sorted(self._latencies.get(model, ()))
+        if len(values) < self.min_samples:
+            return None
+        index = min(len(values) - 1, round(self.percentile / 100 * (len(values) - 1)))
+        return max(self.min_delay, values[index])
+
+    def _observe(self, model: str, latency: float):
+        metrics.observe("llm.first_chunk.unhedged", latency)
+        with self._lock:
+            samples = self._latencies.setdefault(model, deque(maxlen=self._window))
+            samples.append(latency)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def stream(self, model: str, factory, backup_model: str | None = None, backup_factory=None):
+        """Yield the chunks of factory(), hedged with backup_factory() (default: factory again)."""
+        with self._lock:
+            self._budget = min(self.burst, self._budget + self.max_rate)
+        metrics.incr("llm.requests")
+        events = queue.Queue()
+        primary = _Attempt(model, factory, events, lambda latency: self._observe(model, latency))
+        attempts = [primary]
+        deadline = self.deadline(model)
+        winner = None
+        try:
+            while winner is None:
+                timeout = None
+                if deadline is not None and len(attempts) == 1:
+                    timeout = max(0.0, primary.started + deadline - time.monotonic())
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    deadline = None  # at most one hedge per request
+                    if self._take_budget():
+                        metrics.incr("llm.hedged")
+                        attempts.append(
+                            _Attempt(backup_model or model, backup_factory or factory, events)
+                        )
+                    else:
+                        metrics.incr("llm.hedges_skipped")
+                    continue
+
+                if kind == _ERROR:
+                    attempts.remove(attempt)
+                    if not attempts:
+                        raise payload
+                    continue  # the other request may still succeed
+                winner = attempt
+                metrics.observe("llm.first_chunk", time.monotonic() - primary.started)
+                if winner is not primary:
+                    metrics.incr("llm.hedge_wins")
+                for other in attempts:
+                    if other is not winner:
+                        other.cancelled.set()
+
+            while True:
+                if kind == _ERROR:
+                    raise payload
+                if kind == _END:
+                    return
+                yield payload
+                attempt, kind, payload = events.get()
+                while attempt is not winner:
+                    attempt, kind, payload = events.get()
+        finally:
+            for attempt in attempts:
+                attempt.cancelled.set()
+
+
+def hedging_summary() -> dict | None:
+    """Hedge rate and the p99 first-chunk latency with and without hedging, or None."""
+    requests = metrics.count("llm.requests")
+    if not metrics.count("llm.hedged") or not requests:
+        return None
+    return {
+        "rate": metrics.count("llm.hedged") / requests,
+        "wins": metrics.count("llm.hedge_wins"),
+        "p99": metrics.percentile("llm.first_chunk", 99),
+        "p99_unhedged": metrics.percentile("llm.first_chunk.unhedged", 99),
+    }
@@ -0,0 +1,74 @@
+from langchain_core.messages import HumanMessage, ToolMessage
+from app.utils.metrics import metrics
+from app.utils.spill_store import estimate_tokens
+
+# sent back as a user turn when the model's tool call could not be parsed
+MALFORMED_TOOL_CALL = "Error: Your tool call was malformed or non-JSON. Please fix and retry."
+
+# prefixes the tools use for failed results
+_ERROR_MARKERS = ("Error", "❌", "🚫", "⏰", "Content not found", "Return code: ")
+
+
+def is_tool_error(message) -> bool:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return content.startswith(_ERROR_MARKERS) or "\nReturn code: " in content
+
+
+class ModelRouter:
+    """Picks a model tier for every LLM step from cheap features of the history.
+
+    New requests, large contexts, recent tool failures and retries go to the
+    strong tier; routine follow-ups after successful tool calls go to the
+    fast one. A fast step that produces a malformed or failing tool call
+    escalates the next step to the strong tier.
+    """
+
+    def __init__(
+        self,
+        tiers: dict,
+        context_threshold_tokens: int = 12000,
+        error_window: int = 6,
+        error_rate_threshold: float = 0.34,
+    ):
+        self.tiers = tiers
+        self.context_threshold_tokens = context_threshold_tokens
+        self.error_window = error_window
+        self.error_rate_threshold = error_rate_threshold
+
+    def choose(self, messages: list) -> tuple:
+        """Return (tier, reason) for the next LLM step."""
+        if "fast" not in self.tiers:
+            return "strong", "no fast tier"
+
+        last = messages[-1]
+        if isinstance(last, HumanMessage):
+            if last.content == MALFORMED_TOOL_CALL:
+                return "strong", "retry after malformed tool call"
+            return "strong", "new request"
+
+        recent = [m for m in messages[-self.error_window * 2 :] if isinstance(m, ToolMessage)]
+        recent = recent[-self.error_window :]
+        if recent and is_tool_error(recent[-1]):
+            return "strong", "escalated after tool failure"
+        if recent and sum(map(is_tool_error, recent)) / len(recent) >= self.error_rate_threshold:
+            return "strong", "high recent error rate"
+
+        context = sum(estimate_tokens(str(m.content)) for m in messages)
+        if context >= self.context_threshold_tokens:
+            return "strong", "large context"
+
+        return "fast", "tool follow-up"
+
+    def record(self, tier: str, reason: str, latency: float):
+        metrics.incr(f"router.{tier}")
+        metrics.incr(f"router.reason.{reason}")
+        metrics.observe(f"router.latency.{tier}", latency)
+
+
+def estimated_savings() -> float | None:
+    """Seconds saved by fast-tier steps, using the median latency of each tier."""
+    fast = metrics.percentile("router.latency.fast", 50)
+    strong = metrics.percentile("router.latency.strong", 50)
+    if fast is None or strong is None:
+        return None
+    return metrics.count("router.fast") * (strong - fast)
@@ -1,14 +1,183 @@
 import os
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 import subprocess
 import tempfile
 import shlex
 import re
+import ast
+import glob
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.spill_store import SpillStore, MAX_PAGE_CHARS
+from app.utils.journal import WorkspaceJournal
+from app.utils.processes import ProcessRegistry
+from app.utils.sandbox import SandboxLimits, run_sandboxed
+from app.utils.files import is_binary_file, is_ignored, load_ignore_patterns
+from app.utils.read_tracker import ReadTracker
+from app.utils.symbol_index import SymbolIndex, format_outline
+from app.utils.jobs import JobManager
+from app.utils.kernel import KernelManager, format_cell
+from app.utils.profiling import format_profile, run_profile
+from app.utils.testing import TestSelector, format_report, record_file, run_test_worker
+from app.utils.workspace import WorkspaceManager
 # import time
 
 
+# large tool outputs are parked here and referenced by handle in the history
+spill_store = SpillStore()
+
+# pre-images of every file the write tools touch, for /undo and /restore
+journal = WorkspaceJournal()
+
+# file versions already sent to the model, per thread, for delta reads
+read_tracker = ReadTracker()
+
+# process groups of running execute_code/execute_command calls, killed on cancel
+processes = ProcessRegistry()
+
+# rlimits (and cgroup limits where available) for every execute_code/execute_command run
+sandbox_limits = SandboxLimits()
+
+# import graph and last-run state behind run_tests' incremental selection
+test_selector = TestSelector()
+
+# classes, functions and methods of Python files for the symbol-level tools
+symbol_index = SymbolIndex()
+
+# background commands started with start_job, killed when the session ends
+jobs = JobManager()
+
+# one persistent Python process per thread for run_cell
+kernels = KernelManager()
+
+# the tree each thread works in: the shared workspace, or its own overlay when isolated
+workspaces = WorkspaceManager()
+
+# snippets execute_code, run_cell and profile_code refuse outright
+DANGEROUS_CODE_PATTERNS = [
+    r"rm\s+-rf\s+/",
+    r"format\s+c:",
+    r"mkfs\s+/dev/",
+]
+
+# commands execute_command and start_job refuse outright
+DANGEROUS_COMMAND_PATTERNS = [
+    r"^rm\s+-rf\s+/$",
+    r"^dd\s+.*of=/dev/sd[a-z]$",
+    r"^mkfs\s+/dev/sd[a-z]$",
+    r"^fdisk\s+/dev/sd[a-z]$",
+    r":\(\)\{.*\}",
+]
+
+# tools without side effects, safe to start before the model finishes its message
+READ_ONLY_TOOLS = {
+    "read_file",
+    "read_many_files",
+    "list_directory",
+    "fetch_output",
+    "job_status",
+    "job_tail",
+    "tool_help",
+    "outline_file",
+    "read_symbol",
+}
+
+# full tool docstrings, served by tool_help when compact schemas are bound
+tool_guides = {}
+
+_file_change_listeners = []
+
+
+def on_file_change(listener):
+    """Register a callback invoked with the absolute path of every file a write tool touches."""
+    _file_change_listeners.append(listener)
+    return listener
+
+
+def notify_file_change(path: str):
+    """Tell the registered listeners that a file changed outside their view."""
+    path = os.path.abspath(path)
+    for listener in _file_change_listeners:
+        listener(path)
+
+
+on_file_change(symbol_index.mark_dirty)
+
+
+def _blocked(text: str, patterns: list) -> str | None:
+    """Return the refusal for code or a command matching one of the patterns, else None."""
+    for pattern in patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return f"🚫 BLOCKED: Extremely destructive operation: {pattern}"
+    return None
+
+
+def _write_atomic(file_path: str, content: str):
+    """Write through a temp file and rename, so the old inode is never modified."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".projectx-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        if os.path.exists(file_path):
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def _doc_sections(doc: str) -> dict:
+    """Split a "**SECTION**: text" docstring into {section: [lines]}."""
+    sections = {}
+    current = None
+    for line in inspect.cleandoc(doc).splitlines():
+        match = re.match(r"^\*\*([A-Z ]+)\*\*:?\s*(.*)$", line.strip())
+        if match:
+            current = sections.setdefault(match.group(1), [])
+            line = match.group(2)
+        if current is not None and line.strip():
+            current.append(line.strip())
+    return sections
+
+
+def compact_tool(full_tool):
+    """Return a copy of a tool whose schema only carries its purpose, parameters and warnings.
+
+    The complete docstring is kept in tool_guides for tool_help, so the
+    per-request schema stays small without losing the long-form guidance.
+    """
+    tool_guides[full_tool.name] = inspect.cleandoc(full_tool.description)
+    sections = _doc_sections(full_tool.description)
+    if "PRIMARY PURPOSE" not in sections:
+        return full_tool
+
+    lines = [" ".join(sections["PRIMARY PURPOSE"])]
+    # a parameter's description can wrap over several lines
+    parameters = []
+    for line in sections.get("PARAMETERS", []):
+        if re.match(r"^\w+ \(", line) or not parameters:
+            parameters.append(line)
+        else:
+            parameters[-1] += " " + line.lstrip("- ")
+    lines += [f"- {line}" for line in parameters]
+    lines += sections.get("CRITICAL", [])
+    if full_tool.name != "tool_help":
+        lines.append(f'More: tool_help("{full_tool.name}").')
+    return full_tool.model_copy(update={"description": "\n".join(lines)})
+
+
 @tool
-def create_wd(path: str) -> None:
+def create_wd(path: str, config: RunnableConfig = None) -> None:
     """
     **PRIMARY PURPOSE**: Creates a new directory/folder at the specified path.
 
@@ -38,14 +207,14 @@ def create_wd(path: str) -> None:
         create_wd("/home/user/workspace")     # Creates with absolute path
     """
     try:
-        os.makedirs(path, exist_ok=True)
+        journal.makedirs(workspaces.get(config).resolve(path))
         return f"Working directory created at {path}"
     except Exception as e:
         return f"Error creating working directory: {str(e)}"
 
 
 @tool
-def create_file(file_path: str, content: str) -> None:
+def create_file(file_path: str, content: str, config: RunnableConfig = None) -> None:
     """
     **PRIMARY PURPOSE**: Creates a brand new file with specified content.
 
@@ -82,18 +251,22 @@ def create_file(file_path: str, content: str) -> None:
         create_file("README.md", "# My Project\n\nDescription here")
     """
     try:
+        path = workspaces.get(config).resolve(file_path)
         # ensure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        journal.makedirs(os.path.dirname(path))
 
-        with open(file_path, "w") as f:
-            f.write(content)
+        journal.record(path, replaced=True)
+        _write_atomic(path, content)
+        notify_file_change(path)
         return f"File created at {file_path}"
     except Exception as e:
         return f"Error creating file: {str(e)}"
 
 
 @tool
-def modify_file(file_path: str, old_content: str, new_content: str) -> str:
+def modify_file(
+    file_path: str, old_content: str, new_content: str, config: RunnableConfig = None
+) -> str:
     """
     **PRIMARY PURPOSE**: Updates existing files by replacing specific content.
 
@@ -128,7 +301,8 @@ def modify_file(file_path: str, old_content: str, new_content: str) -> str:
         modify_file("config.json", '"theme": "light"', '"theme": "dark"')
     """
     try:
-        with open(file_path, "r") as f:
+        path = workspaces.get(config).resolve(file_path)
+        with open(path, "r") as f:
             contents = f.read()
 
         if old_content not in contents:
@@ -136,15 +310,16 @@ def modify_file(file_path: str, old_content: str, new_content: str) -> str:
 
         contents = contents.replace(old_content, new_content, 1)
 
-        with open(file_path, "w") as f:
-            f.write(contents)
+        journal.record(path, replaced=True)
+        _write_atomic(path, contents)
+        notify_file_change(path)
         return f"File modified at {file_path}"
     except Exception as e:
         return f"Error modifying file: {str(e)}"
 
 
 @tool
-def append_file(file_path: str, content: str) -> str:
+def append_file(file_path: str, content: str, config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Appends new content to the end of an existing file.
 
@@ -178,18 +353,21 @@ def append_file(file_path: str, content: str) -> str:
         append_file("notes.txt", "\n# Additional Notes\nContent here")
     """
     try:
+        path = workspaces.get(config).resolve(file_path)
         # ensure the directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        journal.makedirs(os.path.dirname(path))
 
-        with open(file_path, "a") as f:
+        journal.record(path)
+        with open(path, "a") as f:
             f.write(content)
+        notify_file_change(path)
         return f"Content appended to {file_path}"
     except Exception as e:
         return f"Error appending file: {str(e)}"
 
 
 @tool
-def delete_file(file_path: str) -> str:
+def delete_file(file_path: str, config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Permanently removes a file from the filesystem.
 
@@ -227,14 +405,17 @@ def delete_file(file_path: str) -> str:
         delete_file("/tmp/session.tmp")      # Clean cache file
     """
     try:
-        os.remove(file_path)
+        path = workspaces.get(config).resolve(file_path)
+        journal.record(path, replaced=True)
+        os.remove(path)
+        notify_file_change(path)
         return f"File deleted at {file_path}"
     except Exception as e:
         return f"Error deleting file: {str(e)}"
 
 
 @tool
-def delete_directory(path: str) -> str:
+def delete_directory(path: str, config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Permanently removes a directory and all its contents.
 
@@ -271,14 +452,18 @@ def delete_directory(path: str) -> str:
         delete_directory("/var/logs/old_logs")       # Clean up log directory
     """
     try:
-        os.rmdir(path)
+        target = workspaces.get(config).resolve(path)
+        journal.record(target)
+        os.rmdir(target)
+        notify_file_change(target)
         return f"Directory deleted at {path}"
     except Exception as e:
         return f"Error deleting directory: {str(e)}"
 
 
-@tool
-def read_file(file_path: str) -> str:
+# the artifact carries the read, committed as seen once the result reaches the history
+@tool(response_format="content_and_artifact")
+def read_file(file_path: str, full: bool = False, config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Reads and returns the complete content of any text file.
 
@@ -294,6 +479,8 @@ def read_file(file_path: str) -> str:
     - Preserves all formatting, indentation, and line breaks
     - Works with any text-based file format
     - Will fail if file doesn't exist or isn't readable
+    - Re-reading a file you already read returns a short "unchanged" note, or
+      a unified diff against the version you saw if it changed since
 
     **PARAMETERS**:
         file_path (str): Path to file to read. Examples:
@@ -301,9 +488,11 @@ def read_file(file_path: str) -> str:
                         - "config/settings.json"
                         - "documents/README.md"
                         - "/etc/config/file.txt"
+        full (bool): Return the whole content even if you have already seen it.
+                     Defaults to False
 
     **RETURNS**:
-        str: Complete file contents, or error message if file cannot be read
+        str: Complete file contents, an unchanged note or a diff, or error message
 
     **USE BEFORE**: Making changes to understand current file state
 
@@ -311,17 +500,279 @@ def read_file(file_path: str) -> str:
         read_file("settings.json")           # Check configuration
         read_file("documents/notes.txt")     # Review document content
         read_file("/var/data/report.csv")    # Read data file
+        read_file("main.py", full=True)      # Whole file again after a diff
     """
     try:
-        with open(file_path, "r") as f:
+        path = workspaces.get(config).resolve(file_path)
+        with open(path, "r") as f:
             contents = f.read()
-        return contents
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        return read_tracker.render(thread_id, path, contents, full=full)
+    except Exception as e:
+        return f"Error reading file: {str(e)}", None
+
+
+@tool
+def outline_file(file_path: str, config: RunnableConfig = None) -> str:
+    """
+    **PRIMARY PURPOSE**: Lists the classes, functions and methods of a Python file with their line ranges.
+
+    **WHEN TO USE**:
+    - Before reading a large Python module, to find the part you need
+    - To get the exact symbol names for read_symbol and replace_symbol
+
+    **BEHAVIOR**:
+    - One line per symbol: line range, kind and signature, plus the first docstring line
+    - Methods are indented under their class; functions nested in functions are not listed
+    - Costs a few tokens per symbol instead of the whole file
+
+    **PARAMETERS**:
+        file_path (str): Path to a Python source file
+
+    **RETURNS**:
+        str: The outline, or an error message (including syntax errors)
+
+    **EXAMPLES**:
+        outline_file("app/agent/agent.py")
+    """
+    try:
+        path = workspaces.get(config).resolve(file_path)
+        symbols = symbol_index.symbols(path)
+        with open(path, "r") as f:
+            line_count = sum(1 for _ in f)
+    except SyntaxError as e:
+        return f"Error outlining file: syntax error at line {e.lineno}: {e.msg}"
+    except Exception as e:
+        return f"Error outlining file: {str(e)}"
+
+    if not symbols:
+        return f"{file_path} ({line_count} lines) defines no classes or functions."
+    return "\n".join([f"{file_path} ({line_count} lines)"] + format_outline(symbols))
+
+
+@tool(response_format="content_and_artifact")
+def read_symbol(
+    file_path: str, symbol: str, full: bool = False, config: RunnableConfig = None
+) -> str:
+    """
+    **PRIMARY PURPOSE**: Reads the source of one class, function or method from a Python file.
+
+    **WHEN TO USE**:
+    - Instead of read_file when you only need one definition of a large module
+    - Before replace_symbol, to see the current code
+
+    **BEHAVIOR**:
+    - Returns the exact source including decorators, at its original indentation
+    - Names are qualified: "MyClass", "MyClass.method", "helper"; a bare method name works when unique
+    - Use "name:LINE" to pick one of several definitions with the same name
+    - Like read_file, re-reading an unchanged symbol returns a short note, a changed one a diff
+
+    **PARAMETERS**:
+        file_path (str): Path to a Python source file
+        symbol (str): Qualified symbol name, see outline_file
+        full (bool): Return the whole source even if it was read before (default: False)
+
+    **RETURNS**:
+        str: A header with the line range followed by the source, or an error message
+
+    **EXAMPLES**:
+        read_symbol("app/agent/agent.py", "Agent.run_turn")
+        read_symbol("utils.py", "parse_args")
+    """
+    try:
+        path = workspaces.get(config).resolve(file_path)
+        found = symbol_index.find(path, symbol)
+        with open(path, "r") as f:
+            lines = f.read().splitlines(keepends=True)
+    except SyntaxError as e:
+        return f"Error reading symbol: syntax error at line {e.lineno}: {e.msg}", None
+    except Exception as e:
+        return f"Error reading symbol: {str(e)}", None
+
+    source = "".join(lines[found.start - 1 : found.end])
+    thread_id = (config or {}).get("configurable", {}).get("thread_id")
+    key = f"{path}::{found.name}"
+    body, read = read_tracker.render(thread_id, key, source, full=full)
+    header = f"# {file_path} lines {found.start}-{found.end}: {found.kind} {found.name}"
+    return f"{header}\n{body}", read
+
+
+@tool
+def replace_symbol(
+    file_path: str, symbol: str, new_source: str, config: RunnableConfig = None
+) -> str:
+    """
+    **PRIMARY PURPOSE**: Replaces the whole definition of one class, function or method in a Python file.
+
+    **WHEN TO USE**:
+    - Rewriting a function or method without sending the rest of the file
+    - Larger edits where modify_file would need a big exact old_content block
+
+    **BEHAVIOR**:
+    - Replaces the symbol's lines (decorators included) with new_source
+    - new_source may be written at column 0; it is re-indented to the symbol's original indentation
+    - The edited file must still parse, otherwise nothing is written and the syntax error is returned
+    - The change is recorded for /undo like the other write tools
+
+    **PARAMETERS**:
+        file_path (str): Path to a Python source file
+        symbol (str): Qualified symbol name, see outline_file ("name:LINE" picks one of several)
+        new_source (str): The complete new definition, including its def/class line and decorators
+
+    **RETURNS**:
+        str: The old and new line ranges, or an error message
+
+    **EXAMPLES**:
+        replace_symbol("app/utils/math.py", "mean", "def mean(values):\n    return sum(values) / len(values)\n")
+        replace_symbol("app/agent/agent.py", "Agent.cancel_step", new_method_source)
+    """
+    try:
+        path = workspaces.get(config).resolve(file_path)
+        found = symbol_index.find(path, symbol)
+        with open(path, "r") as f:
+            lines = f.read().splitlines(keepends=True)
+
+        new_lines = new_source.strip("\n").splitlines()
+        current_indent = min(
+            (len(line) - len(line.lstrip()) for line in new_lines if line.strip()), default=0
+        )
+        new_lines = [
+            " " * found.indent + line[current_indent:] if line.strip() else ""
+            for line in new_lines
+        ]
+        updated = lines[: found.start - 1] + [line + "\n" for line in new_lines] + lines[found.end :]
+        contents = "".join(updated)
+        try:
+            ast.parse(contents, filename=file_path)
+        except SyntaxError as e:
+            return (
+                f"Error replacing symbol: the result does not parse (line {e.lineno}: {e.msg}). "
+                f"Nothing was written."
+            )
+
+        journal.record(path, replaced=True)
+        _write_atomic(path, contents)
+        notify_file_change(path)
+        new_end = found.start + len(new_lines) - 1
+        return (
+            f"Replaced {found.kind} {found.name} in {file_path}: "
+            f"lines {found.start}-{found.end} are now {found.start}-{new_end}"
+        )
+    except SyntaxError as e:
+        return f"Error replacing symbol: syntax error at line {e.lineno}: {e.msg}"
     except Exception as e:
-        return f"Error reading file: {str(e)}"
+        return f"Error replacing symbol: {str(e)}"
 
 
 @tool
-def list_directory(path: str = ".") -> str:
+def read_many_files(
+    paths: list[str],
+    max_bytes_per_file: int = 20000,
+    total_budget: int = 80000,
+    config: RunnableConfig = None,
+) -> str:
+    """
+    **PRIMARY PURPOSE**: Reads several files (or glob patterns) in ONE call.
+
+    **WHEN TO USE**:
+    - Getting to know a package, module or project before changing it
+    - Reading all files of one kind at once ("src/**/*.py", "docs/*.md")
+    - Any time you would otherwise call read_file several times in a row
+
+    **BEHAVIOR**:
+    - Expands glob patterns ("*", "?", "**" for any depth), sorted by path
+    - Skips binary files, and files from globs that .gitignore or common tool
+      folders (.git, node_modules, __pycache__, .venv, ...) exclude
+    - Reads the files concurrently
+    - Cuts each file at max_bytes_per_file and stops adding files once
+      total_budget bytes are used; cut and skipped files are clearly marked
+    - Each file starts with a "==> path <==" header
+
+    **PARAMETERS**:
+        paths (list[str]): File paths and/or glob patterns. Examples:
+                          - ["main.py", "app/config.py"]
+                          - ["app/**/*.py"]
+                          - ["README.md", "docs/*.md", "src/utils/*.py"]
+        max_bytes_per_file (int): Per-file cap. Defaults to 20000
+        total_budget (int): Cap for all files together. Defaults to 80000
+
+    **RETURNS**:
+        str: The concatenated files with headers and truncation markers
+
+    **EXAMPLES**:
+        read_many_files(["app/**/*.py"])
+        read_many_files(["conception.md", "workflow.md", "main.py"])
+        read_many_files(["src/*.py"], max_bytes_per_file=4000)
+    """
+    workspace = workspaces.get(config)
+    root = workspace.root
+    patterns = load_ignore_patterns(root)
+    files = []
+    notes = []
+    for pattern in paths:
+        resolved = workspace.resolve(pattern)
+        if glob.has_magic(pattern):
+            matches = sorted(
+                m
+                for m in glob.glob(resolved, recursive=True)
+                if os.path.isfile(m) and not is_ignored(m, root, patterns)
+            )
+            if not matches:
+                notes.append(f"{pattern} (no matching files)")
+            files.extend(matches)
+        elif os.path.isfile(resolved):
+            files.append(resolved)
+        else:
+            notes.append(f"{pattern} (not found)")
+    files = list(dict.fromkeys(files))
+
+    def _shown(path: str) -> str:
+        # as the model would name it: relative inside the workspace
+        if path.startswith(root + os.sep):
+            return os.path.relpath(path, root)
+        return path
+
+    def _read(path: str):
+        shown = _shown(path)
+        try:
+            if is_binary_file(path):
+                return shown, None, os.path.getsize(path)
+            with open(path, "rb") as f:
+                data = f.read(max_bytes_per_file + 1)
+            return shown, data, os.path.getsize(path)
+        except OSError as e:
+            return shown, e, 0
+
+    sections = []
+    used = 0
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for path, data, size in executor.map(_read, files):
+            if data is None:
+                notes.append(f"{path} (binary)")
+                continue
+            if isinstance(data, OSError):
+                notes.append(f"{path} (error: {data.strerror})")
+                continue
+            if used >= total_budget:
+                notes.append(f"{path} (total budget reached)")
+                continue
+
+            limit = min(max_bytes_per_file, total_budget - used)
+            text = data[:limit].decode("utf-8", "replace")
+            used += min(len(data), limit)
+            header = f"==> {path} <=="
+            if size > limit:
+                header = f"==> {path} ({size} bytes, showing first {limit}) <=="
+                text += f"\n[... truncated, {size - limit} more bytes ...]"
+            sections.append(f"{header}\n{text}")
+
+    if notes:
+        sections.append("Skipped: " + ", ".join(notes))
+    return "\n\n".join(sections) if sections else "No files matched."
+
+
+@tool
+def list_directory(path: str = ".", config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Shows all files and folders in a professional ASCII tree structure.
 
@@ -433,10 +884,12 @@ def list_directory(path: str = ".") -> str:
         return items
 
     try:
+        workspace = workspaces.get(config)
+        target = workspace.resolve(path)
         # Add header with path
-        result = [f"{os.path.abspath(path)}/", "│"]
+        result = [f"{workspace.display(target)}/", "│"]
         
-        items = _list_directory_recursive(path)
+        items = _list_directory_recursive(target)
         result.extend(items)
         
         return "\n".join(result)
@@ -445,7 +898,7 @@ def list_directory(path: str = ".") -> str:
 
 
 @tool
-def execute_code(code: str) -> str:
+def execute_code(code: str, config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Safely executes python code snippets in a controlled environment.
 
@@ -457,7 +910,7 @@ def execute_code(code: str) -> str:
 
     **SECURITY RESTRICTIONS**:
     - TIMEOUT: Execution limited to 300 seconds maximum
-    - MEMORY: Basic memory usage monitoring
+    - LIMITS: CPU time, memory, open files, processes and output size are capped
     - EXTREME CAUTION: Only blocks truly destructive operations
 
     **BEHAVIOR**:
@@ -470,7 +923,8 @@ def execute_code(code: str) -> str:
         code (str): The code to execute. Must be valid python code that is safe and non-malicious
 
     **RETURNS**:
-        str: Code output, error messages, or security violation warnings
+        str: Code output, error messages, or security violation warnings,
+             followed by the peak memory and CPU time used
 
     **EXAMPLES**:
         execute_code("print('Hello World')")
@@ -480,15 +934,9 @@ def execute_code(code: str) -> str:
     **SECURITY NOTE**: This tool actively blocks malicious operations!
     """
 
-    dangerous_patterns = [
-        r"rm\s+-rf\s+/",
-        r"format\s+c:",
-        r"mkfs\s+/dev/",
-    ]
-
-    for pattern in dangerous_patterns:
-        if re.search(pattern, code, re.IGNORECASE):
-            return f"🚫 BLOCKED: Extremely destructive operation: {pattern}"
+    blocked = _blocked(code, DANGEROUS_CODE_PATTERNS)
+    if blocked:
+        return blocked
 
     try:
         with tempfile.NamedTemporaryFile(
@@ -497,15 +945,16 @@ def execute_code(code: str) -> str:
             tmp_file.write(code)
             tmp_file_path = tmp_file.name
 
-        result = subprocess.run(
-            ["python", tmp_file_path],
-            capture_output=True,
-            text=True,
-            timeout=300,
-            cwd=os.getcwd(),
-        )
-
-        os.unlink(tmp_file_path) # cleanup
+        try:
+            result = run_sandboxed(
+                ["python", tmp_file_path],
+                processes,
+                sandbox_limits,
+                timeout=300,
+                cwd=workspaces.get(config).root,
+            )
+        finally:
+            os.unlink(tmp_file_path) # cleanup
 
         output = ""
         if result.stdout:
@@ -515,7 +964,8 @@ def execute_code(code: str) -> str:
         if result.returncode != 0:
             output += f"\nReturn code: {result.returncode}"
 
-        return output.strip() if output.strip() else "Code executed successfully"
+        output = output.strip() if output.strip() else "Code executed successfully"
+        return f"{output}\n{result.usage_summary()}"
     
     except subprocess.TimeoutExpired:
         return "⏰ Code execution timed out (300 second limit exceeded)"
@@ -524,7 +974,7 @@ def execute_code(code: str) -> str:
 
 
 @tool
-def execute_command(command: str) -> str:
+def execute_command(command: str, config: RunnableConfig = None) -> str:
     """
     **PRIMARY PURPOSE**: Safely executes linux command-line commands in a controlled environment.
 
@@ -536,6 +986,7 @@ def execute_command(command: str) -> str:
 
     **SECURITY RESTRICTIONS**:
     - TIMEOUT: Commands limited to 300 seconds maximum
+    - LIMITS: CPU time, memory, open files, processes and output size are capped
     - EXTREME ONLY: Only blocks filesystem destruction and hardware access
     - VIRTUAL ENV: Since you're in a VM, most operations are allowed
 
@@ -559,7 +1010,8 @@ def execute_command(command: str) -> str:
         command (str): Shell command to execute (must be safe)
 
     **RETURNS**:
-        str: Command output, error messages, or security violation warnings
+        str: Command output, error messages, or security violation warnings,
+             followed by the peak memory and CPU time used
 
     **EXAMPLES**:
         execute_command("ls -la")
@@ -572,17 +1024,9 @@ def execute_command(command: str) -> str:
     **CAUTION**: You're in a VM, but still be careful with destructive operations!
     """
 
-    extremely_dangerous_commands = [
-        r"^rm\s+-rf\s+/$",
-        r"^dd\s+.*of=/dev/sd[a-z]$",
-        r"^mkfs\s+/dev/sd[a-z]$",
-        r"^fdisk\s+/dev/sd[a-z]$",
-        r":\(\)\{.*\}",
-    ]
-
-    for pattern in extremely_dangerous_commands:
-        if re.search(pattern, command, re.IGNORECASE):
-            return f"🚫 BLOCKED: Extremely destructive operation: {pattern}"
+    blocked = _blocked(command, DANGEROUS_COMMAND_PATTERNS)
+    if blocked:
+        return blocked
 
     try:
         try:
@@ -593,13 +1037,13 @@ def execute_command(command: str) -> str:
         if not parsed_command:
             return "❌ Empty command"
 
-        result = subprocess.run(
+        result = run_sandboxed(
             command,
-            capture_output=True,
-            text=True,
+            processes,
+            sandbox_limits,
             timeout=300,
             shell=True,
-            cwd=os.getcwd(),
+            cwd=workspaces.get(config).root,
         )
 
         output = ""
@@ -610,11 +1054,12 @@ def execute_command(command: str) -> str:
         if result.returncode != 0:
             output += f"\nReturn code: {result.returncode}"
 
-        return (
+        output = (
             output.strip()
             if output.strip()
             else "Command executed successfully (no output)"
         )
+        return f"{output}\n{result.usage_summary()}"
 
     except subprocess.TimeoutExpired:
         return "⏰ Command execution timed out (60 second limit exceeded)"
@@ -626,6 +1071,445 @@ def execute_command(command: str) -> str:
         return f"❌ Execution error: {str(e)}"
 
 
+@tool
+def run_cell(code: str, timeout: int = 120, config: RunnableConfig = None) -> str:
+    """
+    **PRIMARY PURPOSE**: Runs Python code in a persistent kernel that keeps its variables between calls.
+
+    **WHEN TO USE**:
+    - Iterative data work: load a CSV or model once, then explore it over several calls
+    - Anything where setup (imports, parsing, training) is slow and the next steps reuse it
+    - Use execute_code instead for one-off scripts that should start from a clean interpreter
+
+    **BEHAVIOR**:
+    - One kernel per conversation, started on first use in the working directory
+    - Globals, imports and loaded data survive between calls; "_" holds the last result
+    - A trailing expression is shown like in a notebook (Out[n]); open matplotlib figures and
+      objects with image reprs are saved as files and their paths listed
+    - stdout and stderr are captured per cell
+    - A cell still running after `timeout` seconds is interrupted (KeyboardInterrupt) and the kernel keeps its state
+    - Memory is limited (2 GB); a MemoryError keeps the kernel, being killed at the limit loses its state
+    - Use restart_kernel for a clean slate
+
+    **PARAMETERS**:
+        code (str): Python code to run in the kernel
+        timeout (int): Seconds before the cell is interrupted (default: 120, max: 600)
+
+    **RETURNS**:
+        str: Output, errors, the value of a trailing expression and the kernel's memory use
+
+    **EXAMPLES**:
+        run_cell("import pandas as pd\ndf = pd.read_csv('data.csv')\ndf.shape")
+        run_cell("df.groupby('city').price.mean()")
+        run_cell("train(model, epochs=50)", timeout=600)
+    """
+    blocked = _blocked(code, DANGEROUS_CODE_PATTERNS)
+    if blocked:
+        return blocked
+
+    thread_id = (config or {}).get("configurable", {}).get("thread_id") or "default"
+    try:
+        kernel, started = kernels.get(thread_id, workspaces.get(config).root)
+        response = kernel.execute(
+            code, timeout=max(1, min(timeout, 600)), cancel=processes.cancelled
+        )
+    except Exception as e:
+        return f"❌ Kernel error: {str(e)}"
+    output = format_cell(response, kernels.limits)
+    return f"(started a new kernel)\n{output}" if started else output
+
+
+@tool
+def restart_kernel(config: RunnableConfig = None) -> str:
+    """
+    **PRIMARY PURPOSE**: Stops the persistent run_cell kernel so the next cell starts from scratch.
+
+    **WHEN TO USE**:
+    - After changing modules the kernel already imported
+    - When the kernel's state got confusing or uses too much memory
+
+    **BEHAVIOR**:
+    - Kills the kernel of this conversation; all its variables are lost
+    - The next run_cell call starts a fresh kernel
+
+    **RETURNS**:
+        str: Whether a kernel was running
+
+    **EXAMPLES**:
+        restart_kernel()
+    """
+    thread_id = (config or {}).get("configurable", {}).get("thread_id") or "default"
+    if kernels.shutdown(thread_id):
+        return "Kernel stopped; the next run_cell call starts a fresh one."
+    return "No kernel was running; the next run_cell call starts one."
+
+
+@tool
+def profile_code(
+    code: str,
+    top: int = 15,
+    sort_by: str = "cumulative",
+    trace_memory: bool = True,
+    config: RunnableConfig = None,
+) -> str:
+    """
+    **PRIMARY PURPOSE**: Runs python code under a profiler and returns its hotspots and peak memory.
+
+    **WHEN TO USE**:
+    - Finding where a slow script or function spends its time
+    - Comparing two implementations while optimizing
+    - Checking how much memory a piece of code allocates
+
+    **BEHAVIOR**:
+    - Runs the code like execute_code (same sandbox, limits and 300 second timeout) under cProfile
+    - tracemalloc records the peak memory and the biggest allocation sites; it slows the code
+      down, pass trace_memory=False when only timings matter
+    - Returns a compact top-N table of functions; the full profile is saved to a .prof file
+
+    **PARAMETERS**:
+        code (str): Python code to profile
+        top (int): Number of functions in the table. Defaults to 15
+        sort_by (str): "cumulative" (time including callees) or "tottime" (own time). Defaults to "cumulative"
+        trace_memory (bool): Measure memory with tracemalloc. Defaults to True
+
+    **RETURNS**:
+        str: Hotspot table (ncalls, tottime, cumtime, function), peak memory, top allocation
+             sites, the .prof path, and the program's output or error
+
+    **EXAMPLES**:
+        profile_code("from solver import solve\nsolve(load('big.txt'))")
+        profile_code(code, top=25, sort_by="tottime")
+    """
+    blocked = _blocked(code, DANGEROUS_CODE_PATTERNS)
+    if blocked:
+        return blocked
+    try:
+        report, result = run_profile(
+            code,
+            processes,
+            sandbox_limits,
+            timeout=300,
+            cwd=workspaces.get(config).root,
+            top=max(1, min(top, 100)),
+            sort_by=sort_by,
+            trace_memory=trace_memory,
+        )
+    except subprocess.TimeoutExpired:
+        return "⏰ Profiling timed out (300 second limit exceeded)"
+    except Exception as e:
+        return f"❌ Profiling error: {str(e)}"
+
+    output = format_profile(report)
+    if report["error"]:
+        output = f"❌ The code raised an error, profile up to that point:\n{report['error']}\n{output}"
+    if result.stdout.strip():
+        output += f"\n\nOutput:\n{result.stdout.strip()[-2000:]}"
+    if result.stderr.strip():
+        output += f"\n\nErrors:\n{result.stderr.strip()[-2000:]}"
+    return f"{output}\n{result.usage_summary()}"
+
+
+@tool
+def run_tests(
+    paths: list[str] | None = None,
+    run_all: bool = False,
+    framework: str = "auto",
+    config: RunnableConfig = None,
+) -> str:
+    """
+    **PRIMARY PURPOSE**: Runs the Python tests affected by your changes and returns structured pass/fail results.
+
+    **WHEN TO USE**:
+    - After every change to Python code, instead of execute_command("pytest ...")
+    - To check a specific test file or test with `paths`
+    - With run_all=True before finishing a task
+
+    **BEHAVIOR**:
+    - Runs pytest (or unittest when pytest is not installed) in a sandboxed worker in the current directory
+    - Without paths, only runs the test files that import (directly or transitively) a file changed
+      since they last ran, plus the ones that failed last time; the first run runs everything
+    - Returns a one-line summary and, for each failure or error, its id and a short traceback
+    - Same 300 second timeout and resource limits as execute_command
+
+    **PARAMETERS**:
+        paths (list[str]): Test files or pytest node ids to run. Empty selects the affected tests
+        run_all (bool): Run every test file regardless of changes. Defaults to False
+        framework (str): "auto", "pytest" or "unittest". Defaults to "auto"
+
+    **RETURNS**:
+        str: Summary line, which files were selected and why, then the failures with short tracebacks
+
+    **EXAMPLES**:
+        run_tests()
+        run_tests(run_all=True)
+        run_tests(["tests/test_parser.py::test_empty_input"])
+    """
+    workspace = workspaces.get(config)
+    root = workspace.root
+    try:
+        selected, changed, snapshot = test_selector.select(root, run_all=run_all)
+        if paths:
+            targets = list(paths)
+            ran_files = [workspace.resolve(p.split("::")[0]) for p in paths]
+            selection = f"Ran the requested {len(paths)} target(s)."
+        elif not selected:
+            return (
+                f"No tests affected by changes since the last run ({len(snapshot)} test files). "
+                f"Use run_all=True to run everything."
+            )
+        else:
+            targets = [os.path.relpath(p, root) for p in selected]
+            ran_files = selected
+            selection = f"Selected {len(selected)} of {len(snapshot)} test files"
+            if changed:
+                shown = ", ".join(os.path.relpath(p, root) for p in changed[:10])
+                more = f" and {len(changed) - 10} more" if len(changed) > 10 else ""
+                selection += f" (changed: {shown}{more}). Use run_all=True to run everything."
+            else:
+                selection += "."
+
+        report = run_test_worker(
+            targets, processes, sandbox_limits, timeout=300, cwd=root, framework=framework
+        )
+        failing = {
+            record_file(r["id"], root) for r in report["records"] if r["outcome"] in ("failed", "error")
+        }
+        test_selector.finish(snapshot, ran_files, failing - {None})
+        return f"{format_report(report)}\n\n{selection}\n{report['usage']}"
+
+    except subprocess.TimeoutExpired:
+        return "⏰ Test run timed out (300 second limit exceeded)"
+    except Exception as e:
+        return f"❌ Test run error: {str(e)}"
+
+
+@tool
+def start_job(command: str, config: RunnableConfig = None) -> str:
+    """
+    **PRIMARY PURPOSE**: Starts a shell command in the background and returns a job id immediately.
+
+    **WHEN TO USE**:
+    - Starting dev servers, watchers or databases you want to talk to afterwards
+    - Long builds, installs or test runs you want to overlap with other work
+    - Anything that may run longer than the 300 second execute_command limit
+
+    **BEHAVIOR**:
+    - Runs in its own process group with the same memory, file and process limits as execute_command
+    - No timeout and no CPU time limit; the job runs until it exits or is killed
+    - stdout and stderr are merged into a log that keeps the most recent 1 MB
+    - All jobs are killed when the session ends
+
+    **PARAMETERS**:
+        command (str): Shell command to run
+
+    **RETURNS**:
+        str: The job id and status, or an error message
+
+    **EXAMPLES**:
+        start_job("python -m http.server 8000")
+        start_job("npm run build")
+        start_job("pytest -x tests/")
+    """
+    blocked = _blocked(command, DANGEROUS_COMMAND_PATTERNS)
+    if blocked:
+        return blocked
+    try:
+        job = jobs.start(command, cwd=workspaces.get(config).root)
+    except Exception as e:
+        return f"❌ Could not start job: {str(e)}"
+    return (
+        f"{job.summary()}\n"
+        f"Use job_status, job_tail(job_id=\"{job.id}\"), job_wait or kill_job to follow it."
+    )
+
+
+@tool
+def job_status(job_id: str = "") -> str:
+    """
+    **PRIMARY PURPOSE**: Reports whether background jobs are still running.
+
+    **WHEN TO USE**:
+    - Checking if a server started with start_job is still up
+    - Listing all jobs of the session
+
+    **PARAMETERS**:
+        job_id (str): Id returned by start_job. Empty lists every job
+
+    **RETURNS**:
+        str: One status line per job (state, elapsed time, command), with resource usage once finished
+
+    **EXAMPLES**:
+        job_status()
+        job_status("2")
+    """
+    try:
+        selected = [jobs.get(job_id)] if job_id else jobs.jobs()
+    except KeyError:
+        return f"Error: no job with id '{job_id}'"
+    if not selected:
+        return "No background jobs."
+    return "\n".join(job.summary() for job in selected)
+
+
+@tool
+def job_tail(job_id: str, lines: int = 50) -> str:
+    """
+    **PRIMARY PURPOSE**: Shows the last lines of a background job's output.
+
+    **WHEN TO USE**:
+    - Checking a server's log after starting it or sending it a request
+    - Following the progress of a long build or test run
+
+    **PARAMETERS**:
+        job_id (str): Id returned by start_job
+        lines (int): Number of lines from the end of the log. Defaults to 50
+
+    **RETURNS**:
+        str: The job status followed by the requested log lines
+
+    **EXAMPLES**:
+        job_tail("1")
+        job_tail("1", 200)
+    """
+    try:
+        job = jobs.get(job_id)
+    except KeyError:
+        return f"Error: no job with id '{job_id}'"
+    output = "".join(job.log.tail(max(1, lines))).rstrip()
+    if job.log.dropped_lines:
+        output = f"[... {job.log.dropped_lines} earlier lines dropped from the log ...]\n{output}"
+    return f"{job.summary()}\n{output or '(no output yet)'}"
+
+
+@tool
+def job_wait(job_id: str, timeout: float = 60) -> str:
+    """
+    **PRIMARY PURPOSE**: Waits until a background job finishes or the timeout passes.
+
+    **WHEN TO USE**:
+    - After doing other work, when you need the result of a build or test job
+    - Waiting for a job that should finish soon
+
+    **BEHAVIOR**:
+    - Returns as soon as the job exits; the timeout is capped at 300 seconds
+    - The job keeps running if the timeout passes first
+
+    **PARAMETERS**:
+        job_id (str): Id returned by start_job
+        timeout (float): Seconds to wait at most. Defaults to 60
+
+    **RETURNS**:
+        str: The job status followed by the last 50 lines of its output
+
+    **EXAMPLES**:
+        job_wait("1")
+        job_wait("3", 300)
+    """
+    try:
+        job = jobs.wait(job_id, max(0, min(timeout, 300)), cancel=processes.cancelled)
+    except KeyError:
+        return f"Error: no job with id '{job_id}'"
+    output = "".join(job.log.tail(50)).rstrip()
+    note = "" if not job.running else "\n⏰ Still running after the timeout."
+    return f"{job.summary()}{note}\n{output or '(no output)'}"
+
+
+@tool
+def kill_job(job_id: str) -> str:
+    """
+    **PRIMARY PURPOSE**: Stops a background job and everything it started.
+
+    **WHEN TO USE**:
+    - Shutting down a server you no longer need
+    - Stopping a stuck or runaway build
+
+    **PARAMETERS**:
+        job_id (str): Id returned by start_job
+
+    **RETURNS**:
+        str: The final job status followed by the last 20 lines of its output
+
+    **EXAMPLES**:
+        kill_job("1")
+    """
+    try:
+        job = jobs.kill(job_id)
+    except KeyError:
+        return f"Error: no job with id '{job_id}'"
+    output = "".join(job.log.tail(20)).rstrip()
+    return f"{job.summary()}\n{output or '(no output)'}"
+
+
+@tool
+def tool_help(tool_name: str = "") -> str:
+    """
+    **PRIMARY PURPOSE**: Returns the full usage guide of a tool: when to use it, behavior, limits and examples.
+
+    **WHEN TO USE**:
+    - Before using a tool for the first time in a session
+    - When a tool result surprised you or you are unsure about its limits
+
+    **PARAMETERS**:
+        tool_name (str): Name of the tool. Empty lists the tools that have a guide
+
+    **RETURNS**:
+        str: The guide, or the list of tool names
+
+    **EXAMPLES**:
+        tool_help("modify_file")
+        tool_help()
+    """
+    if tool_name in tool_guides:
+        return tool_guides[tool_name]
+    available = ", ".join(sorted(tool_guides))
+    if not tool_name:
+        return f"Guides are available for: {available}"
+    return f"Error: no guide for '{tool_name}'. Guides are available for: {available}"
+
+
+@tool
+def fetch_output(handle: str, start: int = 0, length: int = MAX_PAGE_CHARS) -> str:
+    """
+    **PRIMARY PURPOSE**: Pages through a large tool output that was shortened in the conversation.
+
+    **WHEN TO USE**:
+    - A previous tool result ends with "[... N characters omitted ...]" and a handle
+    - You need the part of a long file, listing or command output that was cut
+
+    **BEHAVIOR**:
+    - Returns the characters from `start` up to `start + length` of the stored output
+    - Reads at most 8000 characters per call, call again with a later start to continue
+    - Handles stay valid for the whole session
+
+    **PARAMETERS**:
+        handle (str): The handle given in the shortened tool result
+        start (int): Character offset to start reading from. Defaults to 0
+        length (int): Number of characters to read. Defaults to (and is capped at) 8000
+
+    **RETURNS**:
+        str: The requested slice with its position, or an error message
+
+    **EXAMPLES**:
+        fetch_output("3f2a9c1b7d4e5f60", 4800)
+        fetch_output("3f2a9c1b7d4e5f60", 12800, 2000)
+    """
+    content = spill_store.get(handle)
+    if content is None:
+        return f"Error fetching output: unknown handle '{handle}'"
+
+    start = max(0, start)
+    end = min(len(content), start + max(1, min(length, MAX_PAGE_CHARS)))
+    if start >= len(content):
+        return f"Error fetching output: start {start} is past the end ({len(content)} characters)"
+
+    footer = (
+        f"[... {len(content) - end} characters remain, continue with start={end} ...]"
+        if end < len(content)
+        else "[end of output]"
+    )
+    return f"[characters {start}-{end} of {len(content)}]\n{content[start:end]}\n{footer}"
+
+
 # @tool
 # def stall(duration: float = 5):
 #     """
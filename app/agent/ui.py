@@ -3,7 +3,7 @@ from rich.console import Console
 from rich.text import Text
 from rich.markdown import Markdown
 from typing import Dict, Any
-from time import sleep
+from time import sleep, strftime, localtime
 
 
 class AgentUI:
@@ -28,6 +28,19 @@ class AgentUI:
             "   Type [bold]'quit'[/bold], [bold]'exit'[/bold], or [bold]'q'[/bold] to end the conversation"
         )
         self.console.print("   Type [bold]'clear'[/bold] to clear conversation history")
+        self.console.print(
+            "   Type [bold]'continue'[/bold] to resume a paused turn"
+        )
+        self.console.print(
+            "   Type [bold]'undo'[/bold] to revert the files changed in the last turn"
+        )
+        self.console.print(
+            "   Type [bold]'snapshots'[/bold] to list turns, [bold]'restore <n>'[/bold] to go back to one"
+        )
+        self.console.print(
+            "   Type [bold]'changes'[/bold], [bold]'merge'[/bold] or [bold]'discard'[/bold] to review, apply or drop an isolated workspace"
+        )
+        self.console.print("   Type [bold]'stats'[/bold] to show routing, latency and tool metrics")
         self.console.print(
             "   Type [bold]'cls'[/bold], [bold]'clearterm'[/bold], or [bold]'clearscreen'[/bold] to clear terminal"
         )
@@ -147,12 +160,137 @@ class AgentUI:
             "green",
         )
 
+    def snapshots(self, snapshots: list):
+        """Display the workspace snapshots that can be restored."""
+        if not snapshots:
+            self.status_message(title="📸 Snapshots", message="No file changes recorded yet.")
+            return
+
+        self.console.print()
+        self.console.print("━" * 38, style="blue")
+        self.console.print("  [blue]📸 Snapshots[/blue]")
+        for index, label, created, file_count in snapshots:
+            if len(label) > 50:
+                label = label[:47] + "..."
+            self.console.print(
+                f"  [bold]{index}[/bold] [dim]{strftime('%H:%M:%S', localtime(created))}[/dim] "
+                f"{label} [dim]({file_count} file(s))[/dim]"
+            )
+        self.console.print()
+
+    def files_restored(self, paths: list):
+        """Display the files reverted by an undo or restore."""
+        if not paths:
+            self.status_message(title="↩️ Undo", message="Nothing to undo.")
+            return
+        self.status_message(
+            title="↩️ Workspace Restored",
+            message="\n  ".join(paths),
+            style="green",
+        )
+
+    def workspace_changes(self, changes: dict, overlay: str | None):
+        """Display the files an isolated workspace changed compared to the shared one."""
+        if overlay is None:
+            self.status_message(
+                title="🗂️ Workspace",
+                message="Not isolated: changes are written to the workspace directly.",
+            )
+            return
+        if not any(changes.values()):
+            self.status_message(title="🗂️ Workspace", message="No changes to merge.")
+            return
+
+        self.console.print()
+        self.console.print("━" * 38, style="blue")
+        self.console.print(f"  [blue]🗂️ Workspace[/blue] [dim]{overlay}[/dim]")
+        for kind, style in (("added", "green"), ("modified", "yellow"), ("deleted", "red")):
+            for rel in changes[kind]:
+                self.console.print(f"  [{style}]{kind[0].upper()}[/{style}] {rel}")
+        self.console.print()
+
+    def workspace_merged(self, merged: list, conflicts: list):
+        """Display the result of merging an isolated workspace."""
+        if merged:
+            self.status_message(
+                title="🔀 Merged",
+                message="\n  ".join(merged),
+                style="green",
+            )
+        if conflicts:
+            self.status_message(
+                title="⚠️ Conflicts",
+                message="Changed in the workspace since this session started, not merged:\n  "
+                + "\n  ".join(conflicts)
+                + "\n  Type 'merge force' to overwrite them.",
+                style="yellow",
+            )
+        if not merged and not conflicts:
+            self.status_message(title="🔀 Merge", message="No changes to merge.")
+
+    def workspace_discarded(self, changes: dict):
+        """Display that the isolated workspace's changes were dropped."""
+        count = sum(len(paths) for paths in changes.values())
+        self.status_message(
+            title="🗑️ Discarded",
+            message=f"Dropped {count} unmerged change(s); the next step starts from the workspace.",
+            style="green",
+        )
+
+    def overlays_kept(self, paths: list):
+        """Display the isolated workspaces left on disk because they have unmerged changes."""
+        self.status_message(
+            title="🗂️ Unmerged Changes Kept",
+            message="\n  ".join(paths),
+            style="yellow",
+        )
+
+    def stats(self, snapshot: dict, savings: float | None = None, hedging: dict | None = None):
+        """Display the session metrics: counters and latency percentiles."""
+        counters, series = snapshot["counters"], snapshot["series"]
+        if not counters and not series:
+            self.status_message(title="📊 Stats", message="No metrics recorded yet.")
+            return
+
+        self.console.print()
+        self.console.print("━" * 38, style="blue")
+        self.console.print("  [blue]📊 Stats[/blue]")
+        for name in sorted(counters):
+            value = counters[name]
+            value = f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+            self.console.print(f"  {name} [dim]·[/dim] [bold]{value}[/bold]")
+        for name in sorted(series):
+            stats = series[name]
+            self.console.print(
+                f"  {name} [dim]· n={stats['count']} · p50 {stats['p50']:.2f}s · "
+                f"p95 {stats['p95']:.2f}s · p99 {stats['p99']:.2f}s[/dim]"
+            )
+        if savings is not None:
+            self.console.print(f"  [green]Estimated time saved by routing: {savings:.1f}s[/green]")
+        if hedging is not None and hedging["p99"] is not None and hedging["p99_unhedged"] is not None:
+            self.console.print(
+                f"  [green]Hedged {hedging['rate']:.1%} of requests ({hedging['wins']:.0f} won) · "
+                f"p99 first chunk {hedging['p99']:.2f}s vs {hedging['p99_unhedged']:.2f}s "
+                f"unhedged ({hedging['p99_unhedged'] - hedging['p99']:+.2f}s)[/green]"
+            )
+        self.console.print()
+
     def session_interrupted(self):
         """Display session interrupted message."""
         self.status_message("🛑", "⚠️ Session Interrupted", "Interrupted by user", "red")
 
-    def recursion_warning(self):
-        """Display recursion warning with user prompt."""
+    def step_cancelled(self, killed_processes: int = 0):
+        """Display step cancelled message."""
+        details = f" and {killed_processes} running process group(s)" if killed_processes else ""
+        self.status_message(
+            title="⏹️ Step Cancelled",
+            message=f"Stopped the current request{details}. Press Ctrl-C again to exit.",
+            emoji="🛑",
+            style="yellow",
+        )
+
+    def recursion_warning(self, progress: str):
+        """Display a notice that the step limit was hit and the turn resumes."""
         self.console.print()
         self.console.print("━" * 45, style="bold yellow")
         self.console.print(
@@ -160,11 +298,36 @@ class AgentUI:
         )
         self.console.print("━" * 45, style="dim yellow")
         self.console.print()
-        self.console.print("  [dim]The agent has been processing for a while.[/dim]")
         self.console.print(
-            "  Would you like to [bold]continue[/bold] or [bold cyan]refine your prompt[/bold cyan]?"
+            "  [dim]Step limit reached, resuming from the last checkpoint.[/dim]"
+        )
+        self.console.print(f"  [dim]{progress}[/dim]")
+        self.console.print()
+
+    def loop_stopped(self, diagnostic: str):
+        """Display why the turn was stopped for repeating the same tool calls."""
+        self.status_message(
+            title="🔁 Loop Detected",
+            message=diagnostic,
+            emoji="🛑",
+            style="yellow",
         )
+
+    def turn_progress(self, progress: str):
+        """Display a one-line progress summary for the running turn."""
+        self.console.print(f"  [dim]⏱  {progress}[/dim]")
+
+    def turn_paused(self, reason: str, progress: str):
+        """Display why the turn was paused and how to resume it."""
+        self.console.print()
+        self.console.print("━" * 45, style="bold yellow")
+        self.console.print("  [bold yellow]⏸️  Turn Paused[/bold yellow]")
+        self.console.print("━" * 45, style="dim yellow")
         self.console.print()
+        self.console.print(f"  [dim]The {reason}. {progress}[/dim]")
+        self.console.print(
+            "  Type [bold]/continue[/bold] to resume or [bold cyan]refine your prompt[/bold cyan]."
+        )
         self.console.print()
 
     def error(self, error_msg: str):
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from app.utils.cache import cache_dir
+from app.utils.files import iter_workspace_files
+from app.utils.spill_store import estimate_tokens
+from app.utils.symbol_index import format_outline, parse_symbols
+
+# read first, in this order; other top-level markdown files follow
+KEY_DOCS = ("readme.md", "readme.rst", "readme.txt", "readme", "conception.md", "workflow.md")
+
+ENTRY_POINTS = ("main.py", "__main__.py", "app.py", "cli.py", "manage.py", "server.py", "run.py")
+
+
+def _digest(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _fit(text: str, budget_tokens: int) -> str:
+    """Cut text at a line boundary to fit the budget."""
+    if estimate_tokens(text) <= budget_tokens:
+        return text
+    lines = text.splitlines()
+    while lines and estimate_tokens("\n".join(lines)) > budget_tokens:
+        lines = lines[: len(lines) * 3 // 4] if len(lines) > 8 else lines[:-1]
+    return "\n".join(lines + ["[...]"]) if lines else ""
+
+
+class WorkspaceBriefing:
+    """Compact overview of a workspace for the system prompt.
+
+    Made of a tree summary, the head of the key docs and an outline of the
+    entry points. Every part is cached on disk under a hash of what it was
+    built from (the file list for the tree, the content for the others), so a
+    rebuild only redoes the parts whose inputs changed.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        budget_tokens: int = 1500,
+        doc_tokens: int = 350,
+        max_docs: int = 4,
+        max_entry_points: int = 3,
+        max_tree_lines: int = 40,
+    ):
+        self.root = os.path.abspath(root)
+        self.budget_tokens = budget_tokens
+        self.doc_tokens = doc_tokens
+        self.max_docs = max_docs
+        self.max_entry_points = max_entry_points
+        self.max_tree_lines = max_tree_lines
+        self._cache_path = os.path.join(cache_dir("briefings"), _digest(self.root)[:16] + ".json")
+
+    def _load_parts(self) -> dict:
+        try:
+            with open(self._cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_parts(self, parts: dict):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self._cache_path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(parts, f)
+        os.replace(tmp, self._cache_path)
+
+    def _tree(self, files: list) -> str:
+        top = {}
+        for rel in files:
+            head, _, rest = rel.partition(os.sep)
+            top.setdefault(head if rest else "", []).append(rest or head)
+        lines = [f"Workspace {self.root} · {len(files)} files"]
+        lines += [f"  {name}" for name in top.pop("", [])]
+        for directory, contents in sorted(top.items()):
+            extensions = Counter(os.path.splitext(name)[1] or "no ext" for name in contents)
+            kinds = ", ".join(f"{count} {ext}" for ext, count in extensions.most_common(3))
+            subdirs = sorted({name.split(os.sep)[0] for name in contents if os.sep in name})
+            sub = f" · {', '.join(d + '/' for d in subdirs[:6])}" if subdirs else ""
+            more = ", ..." if len(subdirs) > 6 else ""
+            lines.append(f"  {directory}/ ({len(contents)} files: {kinds}){sub}{more}")
+        if len(lines) > self.max_tree_lines:
+            hidden = len(lines) - self.max_tree_lines
+            lines = lines[: self.max_tree_lines] + [f"  [... {hidden} more entries]"]
+        return "\n".join(lines)
+
+    def _doc(self, rel: str, content: bytes) -> str:
+        text = content.decode("utf-8", "replace").strip()
+        return f"### {rel}\n{_fit(text, self.doc_tokens)}" if text else ""
+
+    def _outline(self, rel: str, content: bytes) -> str:
+        try:
+            symbols = parse_symbols(content, rel)
+        except (SyntaxError, ValueError):
+            return f"### {rel}\n(does not parse)"
+        if not symbols:
+            # a plain script: its head shows what it wires together
+            text = content.decode("utf-8", "replace").strip()
+            return f"### {rel}\n{_fit(text, self.doc_tokens // 2)}" if text else ""
+        return f"### {rel}\n" + "\n".join(format_outline(symbols, line_numbers=False))
+
+    def build(self) -> str:
+        """Return the briefing within the token budget, or "" for an empty workspace."""
+        files = sorted(
+            os.path.relpath(path, self.root) for path, _ in iter_workspace_files(self.root)
+        )
+        if not files:
+            return ""
+
+        top_level = [rel for rel in files if os.sep not in rel]
+        docs = sorted(
+            (rel for rel in top_level if rel.lower() in KEY_DOCS or rel.lower().endswith(".md")),
+            key=lambda rel: (
+                KEY_DOCS.index(rel.lower()) if rel.lower() in KEY_DOCS else len(KEY_DOCS),
+                rel,
+            ),
+        )[: self.max_docs]
+        entry_points = sorted(
+            (
+                rel
+                for rel in files
+                if os.path.basename(rel) in ENTRY_POINTS and rel.count(os.sep) <= 1
+            ),
+            key=lambda rel: (rel.count(os.sep), ENTRY_POINTS.index(os.path.basename(rel))),
+        )[: self.max_entry_points]
+
+        cached = self._load_parts()
+        parts = {}
+
+        def part(key: str, build) -> str:
+            parts[key] = cached[key] if key in cached else build()
+            return parts[key]
+
+        sections = [part(_digest("tree", self.max_tree_lines, *files), lambda: self._tree(files))]
+        for kind, names, render in (
+            ("doc", docs, self._doc),
+            ("outline", entry_points, self._outline),
+        ):
+            for rel in names:
+                try:
+                    with open(os.path.join(self.root, rel), "rb") as f:
+                        content = f.read()
+                except OSError:
+                    continue
+                sections.append(part(_digest(kind, self.doc_tokens, rel, content), lambda: render(rel, content)))
+
+        if parts.keys() != cached.keys():
+            try:
+                self._save_parts(parts)
+            except OSError:
+                pass  # the cache is only a speed-up
+
+        briefing, remaining = [], self.budget_tokens
+        for section in filter(None, sections):
+            section = _fit(section, remaining)
+            if not section:
+                break
+            briefing.append(section)
+            remaining -= estimate_tokens(section) + 1
+        return "\n\n".join(briefing)
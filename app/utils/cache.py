@@ -0,0 +1,11 @@
+import os
+
+
+def cache_dir(*parts: str) -> str:
+    """Return (and create) a directory under the ProjectX cache root."""
+    root = os.environ.get("PROJECTX_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "projectx"
+    )
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
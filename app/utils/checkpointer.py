@@ -0,0 +1,281 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+MESSAGES_CHANNEL = "messages"
+
+
+class _Refs:
+    """Marker for an already interned message list, serialized as a "refs" blob."""
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+
+class _InterningSerde:
+    """Serializer wrapper that stores message lists as references to interned messages."""
+
+    def __init__(self, saver, inner):
+        self.saver = saver
+        self.inner = inner
+
+    def dumps_typed(self, obj):
+        if isinstance(obj, _Refs):
+            return "refs", obj.payload
+        return self.inner.dumps_typed(obj)
+
+    def loads_typed(self, data):
+        if data[0] == "refs":
+            return self.saver._load_refs(data[1])
+        return self.inner.loads_typed(data)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class DeltaCheckpointSaver(MemorySaver):
+    """In-memory checkpointer that stores message history as deltas.
+
+    Every message is serialized once and interned by content digest
+    (compressing large payloads, which are mostly tool outputs). A checkpoint
+    of the messages channel only records the digests appended since the
+    previous one, with a full list every ``max_delta_depth`` steps. Only the
+    latest ``max_delta_depth`` checkpoints of a thread are kept. Threads are
+    evicted when cleared, when idle for ``idle_ttl`` seconds, or when more
+    than ``max_threads`` are kept, so a long-lived process runs at flat memory.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = 4,
+        idle_ttl: float = 3600,
+        max_delta_depth: int = 32,
+        compress_min_bytes: int = 1024,
+    ):
+        super().__init__()
+        self.serde = _InterningSerde(self, self.serde)
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self.max_delta_depth = max_delta_depth
+        self.compress_min_bytes = compress_min_bytes
+        self.evicted = 0
+        self._lock = threading.RLock()
+        self._messages = {}  # digest -> (type, payload, compressed)
+        self._heads = {}  # (thread, ns) -> (version, digests, depth)
+        self._versions = {}  # (thread, ns, checkpoint id) -> channel versions it reads
+        self._digests = {}  # thread -> {id(message): (message, digest)}
+        self._last_used = OrderedDict()  # thread -> monotonic time
+
+    def with_allowlist(self, extra_allowlist):
+        inner = self.serde.inner
+        if not hasattr(inner, "with_msgpack_allowlist"):
+            return self
+        derived = inner.with_msgpack_allowlist(extra_allowlist)
+        if derived is inner:
+            return self
+        clone = copy.copy(self)
+        clone.serde = _InterningSerde(self, derived)
+        return clone
+
+    # interning
+
+    def _intern(self, thread_id: str, messages: list) -> list:
+        """Return the digests of messages, serializing only the ones not seen before."""
+        seen = self._digests.setdefault(thread_id, {})
+        digests = []
+        for message in messages:
+            cached = seen.get(id(message))
+            if cached is not None and cached[0] is message:
+                digests.append(cached[1])
+                continue
+            kind, payload = self.serde.inner.dumps_typed(message)
+            digest = hashlib.sha256(kind.encode() + b"\0" + payload).hexdigest()
+            if digest not in self._messages:
+                compressed = len(payload) >= self.compress_min_bytes
+                self._messages[digest] = (
+                    kind,
+                    zlib.compress(payload) if compressed else payload,
+                    compressed,
+                )
+            # holding the message keeps its id() from being reused
+            seen[id(message)] = (message, digest)
+            digests.append(digest)
+        return digests
+
+    def _load_refs(self, payload: bytes) -> list:
+        data = json.loads(payload)
+        messages = self.serde.loads_typed(self.blobs[tuple(data["base"])]) if data["base"] else []
+        for digest in data["refs"]:
+            kind, stored, compressed = self._messages[digest]
+            messages.append(
+                self.serde.inner.loads_typed((kind, zlib.decompress(stored) if compressed else stored))
+            )
+        return messages
+
+    @staticmethod
+    def _is_message_list(value) -> bool:
+        return isinstance(value, list) and bool(value) and all(isinstance(m, BaseMessage) for m in value)
+
+    # checkpointer interface
+
+    def get_tuple(self, config):
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        values = checkpoint["channel_values"]
+        with self._lock:
+            if MESSAGES_CHANNEL in new_versions and self._is_message_list(values.get(MESSAGES_CHANNEL)):
+                messages = values[MESSAGES_CHANNEL]
+                digests = self._intern(thread_id, messages)
+                # forget the objects that left the history
+                live = {id(m) for m in messages}
+                seen = self._digests[thread_id]
+                for key in [k for k in seen if k not in live]:
+                    del seen[key]
+
+                head = self._heads.get((thread_id, checkpoint_ns))
+                base, refs, depth = None, digests, 0
+                if (
+                    head is not None
+                    and head[2] < self.max_delta_depth
+                    and digests[: len(head[1])] == head[1]
+                ):
+                    base = [thread_id, checkpoint_ns, MESSAGES_CHANNEL, head[0]]
+                    refs, depth = digests[len(head[1]) :], head[2] + 1
+
+                version = new_versions[MESSAGES_CHANNEL]
+                self._heads[(thread_id, checkpoint_ns)] = (version, digests, depth)
+                payload = json.dumps({"base": base, "refs": refs}).encode()
+                checkpoint = {
+                    **checkpoint,
+                    "channel_values": {**values, MESSAGES_CHANNEL: _Refs(payload)},
+                }
+
+            result = super().put(config, checkpoint, metadata, new_versions)
+            self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(
+                checkpoint["channel_versions"]
+            )
+            self._touch(thread_id)
+            if self._prune(thread_id, checkpoint_ns) | self._evict(keep=thread_id):
+                self._sweep()
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            interned = []
+            for channel, value in writes:
+                if channel == MESSAGES_CHANNEL and self._is_message_list(value):
+                    payload = json.dumps({"base": None, "refs": self._intern(thread_id, value)})
+                    value = _Refs(payload.encode())
+                interned.append((channel, value))
+            return super().put_writes(config, interned, task_id, task_path)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._forget(thread_id)
+            self._sweep()
+
+    # eviction
+
+    def _forget(self, thread_id: str):
+        super().delete_thread(thread_id)
+        self._digests.pop(thread_id, None)
+        self._last_used.pop(thread_id, None)
+        for key in [k for k in self._heads if k[0] == thread_id]:
+            del self._heads[key]
+        for key in [k for k in self._versions if k[0] == thread_id]:
+            del self._versions[key]
+
+    def _touch(self, thread_id: str):
+        self._last_used[thread_id] = time.monotonic()
+        self._last_used.move_to_end(thread_id)
+
+    def _evict(self, keep: str) -> bool:
+        """Forget the idle threads and the least recently used ones over the limit."""
+        now = time.monotonic()
+        evicted = False
+        for thread_id, last_used in list(self._last_used.items()):
+            over_limit = len(self._last_used) > self.max_threads
+            if thread_id != keep and (over_limit or now - last_used > self.idle_ttl):
+                self._forget(thread_id)
+                self.evicted += 1
+                evicted = True
+        return evicted
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> bool:
+        """Drop a thread's checkpoints beyond the latest max_delta_depth, with their blobs."""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        stale = sorted(checkpoints)[: -max(1, self.max_delta_depth)]
+        if not stale:
+            return False
+        for checkpoint_id in stale:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        # the blobs the kept checkpoints read, and the delta bases those build on
+        live = {
+            (thread_id, checkpoint_ns, channel, version)
+            for checkpoint_id in checkpoints
+            for channel, version in self._versions.get(
+                (thread_id, checkpoint_ns, checkpoint_id), {}
+            ).items()
+        }
+        pending = list(live)
+        while pending:
+            blob = self.blobs.get(pending.pop())
+            if blob is not None and blob[0] == "refs":
+                base = json.loads(blob[1])["base"]
+                if base and tuple(base) not in live:
+                    live.add(tuple(base))
+                    pending.append(tuple(base))
+        for key in [k for k in self.blobs if k[:2] == (thread_id, checkpoint_ns) and k not in live]:
+            del self.blobs[key]
+        return True
+
+    def _sweep(self):
+        """Drop interned messages no remaining blob or write refers to."""
+        live = set()
+        stored = [v for v in self.blobs.values()]
+        stored += [w[2] for writes in self.writes.values() for w in writes.values()]
+        for kind, payload in stored:
+            if kind == "refs":
+                live.update(json.loads(payload)["refs"])
+        for digest in [d for d in self._messages if d not in live]:
+            del self._messages[digest]
+
+    def memory_stats(self) -> dict:
+        """Sizes of what is held in memory, for /stats."""
+        with self._lock:
+            message_bytes = sum(len(stored) for _, stored, _ in self._messages.values())
+            blob_bytes = sum(len(payload) for _, payload in self.blobs.values())
+            checkpoint_bytes = sum(
+                len(saved[0][1]) + len(saved[1][1])
+                for namespaces in self.storage.values()
+                for checkpoints in namespaces.values()
+                for saved in checkpoints.values()
+            )
+            write_bytes = sum(
+                len(w[2][1]) for writes in self.writes.values() for w in writes.values()
+            )
+            return {
+                "threads": len(self.storage),
+                "checkpoints": sum(
+                    len(checkpoints)
+                    for namespaces in self.storage.values()
+                    for checkpoints in namespaces.values()
+                ),
+                "interned_messages": len(self._messages),
+                "bytes": message_bytes + blob_bytes + checkpoint_bytes + write_bytes,
+                "evicted_threads": self.evicted,
+            }
@@ -0,0 +1,126 @@
+import fnmatch
+import os
+
+# directories that never hold anything worth showing to the model
+IGNORED_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    "__pycache__",
+    ".pytest_cache",
+    ".mypy_cache",
+    ".ruff_cache",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    "env",
+    "node_modules",
+    "dist",
+    "build",
+    ".idea",
+    ".vscode",
+}
+
+# linux ioctl for copy-on-write clones (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def reflink(src: str, dst: str) -> bool:
+    """Clone src to dst sharing its blocks; False (and no dst) where the filesystem can't."""
+    try:
+        import fcntl
+
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        return True
+    except (ImportError, OSError):
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+
+
+def is_binary_file(path: str, sniff_bytes: int = 8192) -> bool:
+    """Guess whether a file is binary by looking for NUL bytes in its head."""
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(sniff_bytes)
+    except OSError:
+        return True
+
+
+def _ignored_dir(name: str) -> bool:
+    return name in IGNORED_DIRS or name.endswith(".egg-info")
+
+
+def is_workspace_file(path: str, st, root: str, max_file_bytes: int = 512 * 1024) -> bool:
+    """Whether iter_workspace_files(root) would yield a file, given its stat."""
+    rel = os.path.relpath(path, root)
+    if rel.startswith(".." + os.sep) or any(map(_ignored_dir, rel.split(os.sep)[:-1])):
+        return False
+    return os.path.isfile(path) and st.st_size <= max_file_bytes
+
+
+def iter_workspace_files(root: str, max_file_bytes: int = 512 * 1024, max_files: int = 5000):
+    """Yield (path, stat) for the text-sized files under root, skipping ignored dirs."""
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not _ignored_dir(d))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if not os.path.isfile(path) or st.st_size > max_file_bytes:
+                continue
+            yield path, st
+            count += 1
+            if count >= max_files:
+                return
+
+
+def load_ignore_patterns(root: str) -> list:
+    """Read the .gitignore at root into (pattern, negated, dir_only, anchored) tuples."""
+    patterns = []
+    try:
+        with open(os.path.join(root, ".gitignore"), "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return patterns
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        line = line.lstrip("!")
+        dir_only = line.endswith("/")
+        line = line.strip("/") if dir_only else line
+        anchored = "/" in line
+        patterns.append((line.lstrip("/"), negated, dir_only, anchored))
+    return patterns
+
+
+def is_ignored(path: str, root: str, patterns: list) -> bool:
+    """Check a path against the default ignored dirs and .gitignore-style patterns."""
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    if rel.startswith(".."):
+        return False
+    parts = rel.split(os.sep)
+    if any(part in IGNORED_DIRS for part in parts[:-1]):
+        return True
+
+    ignored = False
+    for pattern, negated, dir_only, anchored in patterns:
+        # a directory pattern matches any file below that directory
+        candidates = [os.sep.join(parts[: i + 1]) for i in range(len(parts))]
+        if dir_only:
+            candidates = candidates[:-1]
+        for candidate in candidates:
+            target = candidate if anchored else os.path.basename(candidate)
+            if fnmatch.fnmatch(target, pattern):
+                ignored = not negated
+                break
+    return ignored
@@ -0,0 +1,176 @@
+import atexit
+import itertools
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from app.utils.processes import kill_process_group
+from app.utils.sandbox import SandboxLimits, collect_usage, spawn_sandboxed
+
+
+class LogBuffer:
+    """Keeps the most recent lines of a stream within a byte budget."""
+
+    def __init__(self, max_bytes: int = 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lines = deque()
+        self._size = 0
+        self.dropped_lines = 0
+
+    def append(self, line: str):
+        with self._lock:
+            self._lines.append(line)
+            self._size += len(line)
+            while self._size > self.max_bytes and len(self._lines) > 1:
+                self._size -= len(self._lines.popleft())
+                self.dropped_lines += 1
+
+    def tail(self, lines: int) -> list:
+        with self._lock:
+            return list(itertools.islice(self._lines, max(0, len(self._lines) - lines), None))
+
+
+class Job:
+    """A command running in the background with its output in a LogBuffer."""
+
+    def __init__(self, job_id: str, command: str, proc: subprocess.Popen, log: LogBuffer):
+        self.id = job_id
+        self.command = command
+        self.proc = proc
+        self.log = log
+        self.started = time.time()
+        self.finished = None
+        self.peak_rss_bytes = 0
+        self.cpu_seconds = 0.0
+        self.done = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return not self.done.is_set()
+
+    def summary(self) -> str:
+        elapsed = (self.finished or time.time()) - self.started
+        if self.running:
+            state = "running"
+        elif self.proc.returncode < 0:
+            state = f"killed by signal {-self.proc.returncode}"
+        else:
+            state = f"exited with code {self.proc.returncode}"
+        summary = f"Job {self.id} · {state} · {elapsed:.1f}s · {self.command}"
+        # a killed launcher has no usage to report
+        if not self.running and self.peak_rss_bytes:
+            summary += (
+                f"\nResources: peak RSS {self.peak_rss_bytes / 1024**2:.1f} MB"
+                f" · CPU {self.cpu_seconds:.2f}s"
+            )
+        return summary
+
+
+class JobManager:
+    """Starts background commands in the sandbox and tracks them until session end.
+
+    Each job runs in its own process group under the sandbox limits except
+    the CPU limit, which would kill servers and watchers. stdout and stderr
+    are merged into a bounded log buffer. Finished jobs are forgotten once
+    more than ``max_finished`` have piled up, and every running job is killed
+    when the process exits.
+    """
+
+    def __init__(
+        self,
+        limits: SandboxLimits | None = None,
+        max_running: int = 8,
+        max_finished: int = 20,
+        log_bytes: int = 1024 * 1024,
+    ):
+        self.limits = limits or SandboxLimits(cpu_seconds=None)
+        self.max_running = max_running
+        self.max_finished = max_finished
+        self.log_bytes = log_bytes
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        atexit.register(self.kill_all)
+
+    def start(self, command: str, cwd: str | None = None) -> Job:
+        with self._lock:
+            if sum(job.running for job in self._jobs.values()) >= self.max_running:
+                raise RuntimeError(
+                    f"{self.max_running} jobs are already running, wait for or kill one first"
+                )
+            job_id = str(next(self._ids))
+
+        proc, status_read, cgroup = spawn_sandboxed(
+            command, self.limits, shell=True, cwd=cwd or os.getcwd(), stderr=subprocess.STDOUT
+        )
+        job = Job(job_id, command, proc, LogBuffer(self.log_bytes))
+        with self._lock:
+            self._jobs[job_id] = job
+            self._forget_finished()
+
+        reader = threading.Thread(target=self._read, args=(job,), daemon=True)
+        reader.start()
+        threading.Thread(
+            target=self._watch, args=(job, status_read, cgroup, reader), daemon=True
+        ).start()
+        return job
+
+    def _read(self, job: Job):
+        for line in iter(lambda: job.proc.stdout.readline(65536), b""):
+            job.log.append(line.decode("utf-8", "replace"))
+        job.proc.stdout.close()
+
+    def _watch(self, job: Job, status_read: int, cgroup: str | None, reader: threading.Thread):
+        with os.fdopen(status_read, "rb") as status:
+            report = status.read()
+        job.proc.wait()
+        # children left behind (e.g. started with &) die with the job
+        kill_process_group(job.proc)
+        reader.join()
+        job.peak_rss_bytes, job.cpu_seconds = collect_usage(report, cgroup)
+        job.finished = time.time()
+        job.done.set()
+
+    def _forget_finished(self):
+        finished = [job for job in self._jobs.values() if not job.running]
+        for job in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            job = self._jobs.get(str(job_id).strip())
+        if job is None:
+            raise KeyError(f"No job with id {job_id}")
+        return job
+
+    def jobs(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def any_running(self) -> bool:
+        return any(job.running for job in self.jobs())
+
+    def wait(self, job_id: str, timeout: float, cancel: threading.Event | None = None) -> Job:
+        """Wait up to ``timeout`` seconds for a job to finish, or until ``cancel`` is set."""
+        job = self.get(job_id)
+        deadline = time.monotonic() + timeout
+        while not job.done.wait(min(0.1, max(0, deadline - time.monotonic()))):
+            if time.monotonic() >= deadline or (cancel is not None and cancel.is_set()):
+                break
+        return job
+
+    def kill(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        if job.running:
+            kill_process_group(job.proc)
+            job.done.wait(5)
+        return job
+
+    def kill_all(self) -> int:
+        """Kill every running job. Returns how many were running."""
+        running = [job for job in self.jobs() if job.running]
+        for job in running:
+            kill_process_group(job.proc)
+        return len(running)
@@ -0,0 +1,179 @@
+import atexit
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from app.utils.cache import cache_dir
+from app.utils.files import reflink
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class WorkspaceJournal:
+    """Per-turn snapshots of the pre-images of files touched by the write tools.
+
+    Pre-images live in a deduplicated content-addressed object store. Objects
+    are reflinked when the filesystem supports it, hardlinked when the caller
+    is about to replace or unlink the path (so the old inode is never written
+    again), and copied otherwise. A snapshot only holds the paths changed
+    during its turn, so taking one costs nothing for untouched files.
+    """
+
+    def __init__(self, directory: str | None = None, max_snapshots: int = 50):
+        self._directory = directory
+        self.max_snapshots = max_snapshots
+        self._snapshots = []
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            # one store per process; it only needs to outlive the session
+            self._directory = cache_dir("journal", f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+            atexit.register(shutil.rmtree, self._directory, True)
+        return self._directory
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def begin_snapshot(self, label: str):
+        """Start a new snapshot; changes until the next call belong to it."""
+        if self._snapshots and not self._snapshots[-1]["entries"]:
+            self._snapshots.pop()
+        self._snapshots.append({"label": label, "created": time.time(), "entries": {}})
+        if len(self._snapshots) > self.max_snapshots:
+            self._snapshots.pop(0)
+            self._prune()
+
+    def record(self, path: str, replaced: bool = False):
+        """Save the pre-image of path unless the current snapshot already has it.
+
+        Pass replaced=True when the caller will unlink or atomically replace
+        the path afterwards, which allows hardlinking instead of copying.
+        """
+        if not self._snapshots:
+            self.begin_snapshot("(before first turn)")
+        entries = self._snapshots[-1]["entries"]
+        path = os.path.abspath(path)
+        if path in entries:
+            return
+
+        if os.path.isdir(path):
+            entries[path] = ("dir",)
+        elif os.path.isfile(path):
+            digest = self._store(path, replaced)
+            entries[path] = ("file", digest, os.stat(path).st_mode & 0o7777)
+        else:
+            entries[path] = ("missing",)
+
+    def makedirs(self, path: str):
+        """Create a directory and its missing parents, recording the ones it creates."""
+        created = []
+        parent = os.path.abspath(path)
+        while not os.path.exists(parent):
+            created.append(parent)
+            parent = os.path.dirname(parent)
+        for directory in created:
+            self.record(directory)  # missing: undo removes it again if empty
+        os.makedirs(path, exist_ok=True)
+
+    def _store(self, path: str, linkable: bool) -> str:
+        digest = _file_digest(path)
+        object_path = self._object_path(digest)
+        if os.path.exists(object_path):
+            return digest
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.tmp"
+        if not reflink(path, tmp_path):
+            try:
+                if not linkable:
+                    raise OSError("in-place write, hardlink would alias the new content")
+                os.link(path, tmp_path)
+            except OSError:
+                shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, object_path)
+        return digest
+
+    def _prune(self):
+        live = {
+            entry[1]
+            for snapshot in self._snapshots
+            for entry in snapshot["entries"].values()
+            if entry[0] == "file"
+        }
+        for dirpath, _, filenames in os.walk(self.directory, topdown=False):
+            for name in filenames:
+                if os.path.basename(dirpath) + name not in live:
+                    os.unlink(os.path.join(dirpath, name))
+            if dirpath != self.directory and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+    def snapshots(self) -> list:
+        """Return (index, label, created, changed file count) for snapshots with changes."""
+        return [
+            (i, s["label"], s["created"], len(s["entries"]))
+            for i, s in enumerate(self._snapshots)
+            if s["entries"]
+        ]
+
+    def undo(self) -> list:
+        """Revert the most recent snapshot with changes. Returns the restored paths."""
+        for i in range(len(self._snapshots) - 1, -1, -1):
+            if self._snapshots[i]["entries"]:
+                return self.restore(i)
+        return []
+
+    def restore(self, index: int) -> list:
+        """Revert the workspace to how it was when snapshot `index` began.
+
+        That snapshot and every later one are consumed. Returns the restored paths.
+        """
+        if not 0 <= index < len(self._snapshots):
+            raise IndexError(f"No snapshot #{index}")
+
+        restored = []
+        while len(self._snapshots) > index:
+            snapshot = self._snapshots.pop()
+            restored.extend(self._revert(snapshot["entries"]))
+        self._prune()
+        return sorted(set(restored))
+
+    def _revert(self, entries: dict) -> list:
+        depth = lambda item: item[0].count(os.sep)
+        dirs = sorted((i for i in entries.items() if i[1][0] == "dir"), key=depth)
+        files = [i for i in entries.items() if i[1][0] == "file"]
+        missing = sorted(
+            (i for i in entries.items() if i[1][0] == "missing"), key=depth, reverse=True
+        )
+
+        for path, _ in dirs:
+            os.makedirs(path, exist_ok=True)
+
+        for path, (_, digest, mode) in files:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.projectx-restore"
+            # never hardlink back: in-place appends would corrupt the object
+            if not reflink(self._object_path(digest), tmp_path):
+                shutil.copyfile(self._object_path(digest), tmp_path)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+
+        for path, _ in missing:
+            if os.path.isdir(path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+            elif os.path.lexists(path):
+                os.unlink(path)
+
+        return list(entries)
@@ -0,0 +1,265 @@
+import atexit
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from app.utils.cache import cache_dir
+from app.utils.processes import kill_process_group
+from app.utils.sandbox import SandboxLimits, collect_usage, spawn_sandboxed
+
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_worker.py")
+
+
+class Kernel:
+    """A long-lived Python worker in the sandbox that keeps its globals between cells."""
+
+    def __init__(self, limits: SandboxLimits, cwd: str, max_output: int, interrupt_grace: float):
+        self.interrupt_grace = interrupt_grace
+        self.cells = 0
+        self.last_used = time.monotonic()
+        self.peak_rss_bytes = 0
+        self.lock = threading.Lock()  # one cell at a time
+        self._responses = queue.Queue()
+        self._stray = []
+        self._stray_lock = threading.Lock()
+        self._max_output = max_output
+        self._running = False
+        self._done = threading.Event()
+        # a directory per kernel: image names only count cells, which restart at 1
+        image_dir = cache_dir("kernel", f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        options = {"max_output": max_output, "image_dir": image_dir}
+        self.proc, status_read, cgroup = spawn_sandboxed(
+            [sys.executable, _WORKER, json.dumps(options)],
+            limits,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+        )
+        threading.Thread(target=self._read_responses, daemon=True).start()
+        threading.Thread(target=self._read_stray, daemon=True).start()
+        threading.Thread(target=self._watch, args=(status_read, cgroup), daemon=True).start()
+
+    @property
+    def alive(self) -> bool:
+        return not self._done.is_set()
+
+    def _read_responses(self):
+        for line in self.proc.stdout:
+            self._responses.put(json.loads(line))
+        self._responses.put(None)  # the worker died
+
+    def _read_stray(self):
+        # fd-level output of the cells and their child processes
+        for block in iter(lambda: self.proc.stderr.read1(65536), b""):
+            with self._stray_lock:
+                kept = sum(map(len, self._stray))
+                if kept < self._max_output:
+                    self._stray.append(block[: self._max_output - kept])
+
+    def _take_stray(self) -> str:
+        with self._stray_lock:
+            stray, self._stray = self._stray, []
+        return b"".join(stray).decode("utf-8", "replace")
+
+    def _watch(self, status_read: int, cgroup: str | None):
+        with os.fdopen(status_read, "rb") as status:
+            report = status.read()
+        self.proc.wait()
+        kill_process_group(self.proc)
+        self.peak_rss_bytes, _ = collect_usage(report, cgroup)
+        self._done.set()
+
+    def _died(self, reason: str | None = None) -> dict:
+        self._done.wait(5)
+        return {
+            "status": "died",
+            "returncode": self.proc.returncode,
+            "reason": reason,
+            "output": self._take_stray(),
+        }
+
+    def _next_response(self, timeout: float, cancel: threading.Event | None):
+        """The worker's next response; queue.Empty after ``timeout`` or once ``cancel`` is set."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (cancel is not None and cancel.is_set()):
+                raise queue.Empty
+            try:
+                return self._responses.get(timeout=min(0.1, remaining))
+            except queue.Empty:
+                pass
+
+    def execute(self, code: str, timeout: float, cancel: threading.Event | None = None) -> dict:
+        """Run a cell and return the worker's response.
+
+        A cell still running after ``timeout``, or once ``cancel`` is set, is
+        interrupted with SIGINT and keeps the kernel; one that ignores the
+        interrupt for ``interrupt_grace`` seconds takes the kernel down with
+        it. The status is "ok", "error", "interrupted", "timeout" or "died".
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            if not self.alive:
+                return self._died()
+            self.cells += 1
+            self._take_stray()
+            request = json.dumps({"cell": self.cells, "code": code}) + "\n"
+            try:
+                self.proc.stdin.write(request.encode())
+                self.proc.stdin.flush()
+            except OSError:
+                return self._died()
+
+            self._running = True
+            try:
+                try:
+                    response = self._next_response(timeout, cancel)
+                except queue.Empty:
+                    self.interrupt()
+                    try:
+                        response = self._responses.get(timeout=self.interrupt_grace)
+                    except queue.Empty:
+                        self.shutdown()
+                        return self._died(
+                            f"killed after ignoring the interrupt for {self.interrupt_grace:.0f}s"
+                        )
+                    timed_out = cancel is None or not cancel.is_set()
+                    if response is not None and response["status"] == "interrupted" and timed_out:
+                        response["status"] = "timeout"
+            finally:
+                self._running = False
+                self.last_used = time.monotonic()
+
+            if response is None:
+                return self._died()
+            response["cell"] = self.cells
+            # fd-level output of the cell's child processes, mostly what they print
+            response["stdout"] += self._take_stray()
+            return response
+
+    def interrupt(self) -> bool:
+        """Send SIGINT to the running cell and its children. Returns whether one was running."""
+        if not self._running:
+            return False
+        try:
+            os.killpg(self.proc.pid, signal.SIGINT)
+        except (ProcessLookupError, PermissionError):
+            pass
+        return True
+
+    def shutdown(self):
+        kill_process_group(self.proc)
+
+
+class KernelManager:
+    """One kernel per agent thread, started on first use.
+
+    Kernels run under the sandbox limits without the CPU limit, which would
+    add up over a kernel's life; a cell that overruns its timeout is
+    interrupted instead. At most ``max_kernels`` are kept, the least recently
+    used idle one is shut down to make room, and every kernel dies with the
+    process.
+    """
+
+    def __init__(
+        self,
+        limits: SandboxLimits | None = None,
+        max_kernels: int = 4,
+        max_output: int = 64 * 1024,
+        interrupt_grace: float = 5.0,
+    ):
+        self.limits = limits or SandboxLimits(cpu_seconds=None, memory_bytes=2 * 1024**3)
+        self.max_kernels = max_kernels
+        self.max_output = max_output
+        self.interrupt_grace = interrupt_grace
+        self._lock = threading.Lock()
+        self._kernels = {}
+        atexit.register(self.shutdown_all)
+
+    def get(self, thread_id: str, cwd: str) -> tuple:
+        """Return (kernel, started) for a thread, starting a fresh kernel if it has none."""
+        with self._lock:
+            kernel = self._kernels.get(thread_id)
+            if kernel is not None and kernel.alive:
+                return kernel, False
+            others = {t: k for t, k in self._kernels.items() if t != thread_id and k.alive}
+            idle = sorted(
+                (t for t, k in others.items() if not k.lock.locked()),
+                key=lambda t: others[t].last_used,
+            )
+            for victim in idle[: max(0, len(others) - self.max_kernels + 1)]:
+                others.pop(victim).shutdown()
+            self._kernels = others
+            kernel = Kernel(self.limits, cwd, self.max_output, self.interrupt_grace)
+            self._kernels[thread_id] = kernel
+            return kernel, True
+
+    def shutdown(self, thread_id: str) -> bool:
+        """Stop a thread's kernel. Returns whether it had one."""
+        with self._lock:
+            kernel = self._kernels.pop(thread_id, None)
+        if kernel is None:
+            return False
+        kernel.shutdown()
+        return True
+
+    def interrupt_all(self) -> int:
+        """Interrupt every running cell, keeping the kernels. Returns how many were running."""
+        with self._lock:
+            kernels = list(self._kernels.values())
+        return sum(kernel.interrupt() for kernel in kernels)
+
+    def shutdown_all(self):
+        with self._lock:
+            kernels, self._kernels = list(self._kernels.values()), {}
+        for kernel in kernels:
+            kernel.shutdown()
+
+
+def format_cell(response: dict, limits: SandboxLimits) -> str:
+    """Render a cell response like execute_code's output, plus the kernel's memory."""
+    status = response["status"]
+    if status == "died":
+        if response["reason"]:
+            cause = response["reason"]
+        elif response["returncode"] == -signal.SIGKILL and limits.memory_bytes:
+            cause = f"killed, likely at the {limits.memory_bytes / 1024**2:.0f} MB memory limit"
+        else:
+            cause = f"exit code {response['returncode']}"
+        output = (
+            f"❌ The kernel died ({cause}) and its variables are lost; "
+            "the next call starts a fresh kernel."
+        )
+        if response["output"].strip():
+            output += f"\nOutput:\n{response['output'].strip()}"
+        return output
+
+    cell = f"[{response['cell']}]"
+    if status == "error":
+        lines = [f"Error in cell {cell}, the kernel keeps its state:\n{response['error'].strip()}"]
+    elif status in ("interrupted", "timeout"):
+        reason = "timed out" if status == "timeout" else "was interrupted"
+        lines = [f"⏰ Cell {cell} {reason}; the kernel keeps its state."]
+        if response["error"]:
+            lines.append(response["error"].strip())
+    else:
+        lines = []
+    if response["stdout"]:
+        lines.append(f"Output:\n{response['stdout'].rstrip()}")
+    if response["stderr"].strip():
+        lines.append(f"Errors:\n{response['stderr'].rstrip()}")
+    if response["result"] is not None:
+        lines.append(f"Out{cell}: {response['result']}")
+    if response["images"]:
+        lines.append("Images: " + ", ".join(response["images"]))
+    if not lines:
+        lines.append(f"Cell {cell} executed successfully")
+    lines.append(
+        f"Kernel: cell {cell} took {response['duration']:.3f}s · RSS {response['rss'] / 1024**2:.1f} MB"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,195 @@
+"""Kernel worker: a long-lived interpreter that runs cells sent as JSON lines.
+
+Usage: python kernel_worker.py '<json options>'
+
+Each request ({"cell": n, "code": "..."}) arrives as one line on stdin and
+gets one JSON line back on stdout. Both streams are moved to private fds
+first, so cells and their child processes cannot touch the protocol; their
+fd-level output lands on stderr. SIGINT interrupts the running cell and is
+ignored between cells. Options: max_output (characters kept per stream and
+cell) and image_dir (where image reprs and open matplotlib figures are
+saved). Kept free of app imports, it runs with the workspace as cwd.
+"""
+
+import ast
+import io
+import json
+import linecache
+import os
+import resource
+import signal
+import sys
+import time
+import traceback
+
+
+class _Capture(io.TextIOBase):
+    """A text stream that keeps the first max_chars characters written to it."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts = []
+        self.size = 0
+        self.dropped = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        kept = text[: max(0, self.max_chars - self.size)]
+        if kept:
+            self.parts.append(kept)
+        self.size += len(kept)
+        self.dropped += len(text) - len(kept)
+        return len(text)
+
+    def value(self) -> str:
+        text = "".join(self.parts)
+        if self.dropped:
+            text += f"\n[... {self.dropped} more characters not shown ...]"
+        return text
+
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _save_images(value, cell: int, image_dir: str) -> list:
+    saved = []
+    for method, ext, mode in (("_repr_png_", "png", "wb"), ("_repr_svg_", "svg", "w")):
+        render = getattr(value, method, None)
+        if not callable(render):
+            continue
+        try:
+            data = render()
+        except Exception:
+            continue
+        if isinstance(data, tuple):  # (data, metadata)
+            data = data[0]
+        if data:
+            path = os.path.join(image_dir, f"cell-{cell}.{ext}")
+            with open(path, mode) as f:
+                f.write(data)
+            saved.append(path)
+            break
+    return saved
+
+
+def _save_figures(cell: int, image_dir: str) -> list:
+    """Save and close the matplotlib figures a cell left open."""
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is None:
+        return []
+    saved = []
+    for number in pyplot.get_fignums():
+        path = os.path.join(image_dir, f"cell-{cell}-figure-{number}.png")
+        pyplot.figure(number).savefig(path)
+        saved.append(path)
+    pyplot.close("all")
+    return saved
+
+
+def _display(value) -> str:
+    render = getattr(value, "_repr_markdown_", None)
+    if callable(render):
+        try:
+            text = render()
+            if text:
+                return text
+        except Exception:
+            pass
+    return repr(value)
+
+
+def _format_error(error: BaseException) -> str:
+    if isinstance(error, SyntaxError):
+        return "".join(traceback.format_exception_only(error))
+    frames = traceback.extract_tb(error.__traceback__)
+    # start at the cell, the worker's own frames are noise
+    while frames and not frames[0].filename.startswith("<cell "):
+        frames.pop(0)
+    lines = traceback.format_list(frames) + traceback.format_exception_only(error)
+    return "Traceback (most recent call last):\n" + "".join(lines)
+
+
+def run_cell(code: str, cell: int, namespace: dict, options: dict) -> dict:
+    stdout = _Capture(options["max_output"])
+    stderr = _Capture(options["max_output"])
+    response = {"status": "ok", "result": None, "error": None, "images": []}
+    filename = f"<cell {cell}>"
+    linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+    sys.stdout, sys.stderr = stdout, stderr
+    started = time.perf_counter()
+    try:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        tree = ast.parse(code, filename=filename)
+        # like a REPL, a trailing expression is evaluated and shown
+        last = None
+        if tree.body and isinstance(tree.body[-1], ast.Expr):
+            last = ast.Expression(tree.body.pop().value)
+        exec(compile(tree, filename, "exec"), namespace)
+        if last is not None:
+            value = eval(compile(last, filename, "eval"), namespace)
+            if value is not None:
+                namespace["_"] = value
+                response["result"] = _display(value)[: options["max_output"]]
+                response["images"] = _save_images(value, cell, options["image_dir"])
+    except KeyboardInterrupt as e:
+        response["status"] = "interrupted"
+        response["error"] = _format_error(e)
+    except BaseException as e:
+        # SystemExit included: the kernel outlives the cell
+        response["status"] = "error"
+        response["error"] = _format_error(e)
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+
+    try:
+        response["images"] += _save_figures(cell, options["image_dir"])
+    except Exception as e:
+        stderr.write(f"\n[could not save the open figures: {e}]")
+    response.update(
+        stdout=stdout.value(),
+        stderr=stderr.value(),
+        duration=time.perf_counter() - started,
+        rss=_rss(),
+    )
+    return response
+
+
+def main():
+    options = json.loads(sys.argv[1])
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    sys.path.insert(0, os.getcwd())
+
+    # keep the protocol streams for ourselves: stdin becomes /dev/null, stdout stderr
+    requests = os.fdopen(os.dup(0), "r")
+    responses = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+    sys.stdin = open(os.devnull)
+    sys.__stdout__ = sys.stdout = os.fdopen(1, "w", buffering=1, closefd=False)
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    for line in requests:
+        request = json.loads(line)
+        try:
+            response = run_cell(request["code"], request["cell"], namespace, options)
+        except KeyboardInterrupt:
+            # the interrupt landed just as the cell finished
+            response = {"status": "interrupted", "result": None, "error": None, "images": []}
+            response.update(stdout="", stderr="", duration=0.0, rss=_rss())
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import threading
+from collections import Counter, deque
+
+
+class Metrics:
+    """Process-wide counters and recent samples, shown by /stats."""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._samples = {}
+
+    def incr(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def set(self, name: str, value: float):
+        """Record a gauge, shown alongside the counters."""
+        with self._lock:
+            self._counters[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.max_samples)
+            samples.append(value)
+
+    def count(self, name: str) -> float:
+        with self._lock:
+            return self._counters[name]
+
+    def samples(self, name: str) -> list:
+        with self._lock:
+            return list(self._samples.get(name, ()))
+
+    def percentile(self, name: str, p: float) -> float | None:
+        """Return the p-th percentile (0-100) of the recent samples, or None."""
+        values = sorted(self.samples(name))
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+        return values[index]
+
+    def snapshot(self) -> dict:
+        """Counters plus count/p50/p95/p99 for every sampled series."""
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._samples)
+        series = {
+            name: {
+                "count": len(self.samples(name)),
+                "p50": self.percentile(name, 50),
+                "p95": self.percentile(name, 95),
+                "p99": self.percentile(name, 99),
+            }
+            for name in names
+        }
+        return {"counters": counters, "series": series}
+
+
+metrics = Metrics()
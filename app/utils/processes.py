@@ -0,0 +1,68 @@
+import os
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+
+
+def kill_process_group(proc: subprocess.Popen):
+    """Kill a process started in its own session together with all its children."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ProcessRegistry:
+    """Tracks the process groups started by tools so a cancel can kill them.
+
+    ``cancelled`` is set once an interrupt arrives, for tools that block on
+    something other than their own process (a job, a kernel cell) to poll.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.cancelled = threading.Event()
+
+    def register(self, proc: subprocess.Popen):
+        with self._lock:
+            self._processes.add(proc)
+
+    def unregister(self, proc: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(proc)
+
+    def kill_all(self) -> int:
+        """Kill every running tool process group. Returns how many were killed."""
+        with self._lock:
+            processes = list(self._processes)
+        for proc in processes:
+            kill_process_group(proc)
+        return len(processes)
+
+
+@contextmanager
+def kill_on_interrupt(registry: ProcessRegistry, *on_interrupt):
+    """Kill the registered process groups the moment SIGINT arrives.
+
+    Tools run in worker threads the main thread joins before a
+    KeyboardInterrupt can surface, so the children are killed from the
+    signal handler itself to let those threads return right away. The
+    ``on_interrupt`` callbacks run there too, for tools that stop their work
+    without being killed, and ``registry.cancelled`` is set for the waits.
+    """
+
+    def handler(signum, frame):
+        registry.cancelled.set()
+        registry.kill_all()
+        for callback in on_interrupt:
+            callback()
+        raise KeyboardInterrupt
+
+    registry.cancelled.clear()
+    previous = signal.signal(signal.SIGINT, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
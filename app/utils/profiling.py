@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import uuid
+from app.utils.cache import cache_dir
+from app.utils.processes import ProcessRegistry
+from app.utils.sandbox import SandboxLimits, run_sandboxed
+
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiling_worker.py")
+
+
+def _prune(directory: str, keep: int):
+    profiles = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for path in profiles[:-keep]:
+        os.unlink(path)
+
+
+def run_profile(
+    code: str,
+    registry: ProcessRegistry,
+    limits: SandboxLimits,
+    timeout: float,
+    cwd: str,
+    top: int = 15,
+    sort_by: str = "cumulative",
+    trace_memory: bool = True,
+    keep_profiles: int = 20,
+) -> tuple:
+    """Profile a snippet in a sandboxed worker. Returns (report, SandboxResult).
+
+    The full pstats profile is kept under the cache dir (the latest
+    ``keep_profiles`` of them) and its path is in report["prof"]. Raises
+    RuntimeError with the tail of the worker output when it died before
+    writing a report, and subprocess.TimeoutExpired on timeout.
+    """
+    directory = cache_dir("profiles")
+    run_id = uuid.uuid4().hex[:12]
+    script = os.path.join(directory, f"{run_id}.py")
+    report_path = os.path.join(directory, f"{run_id}.json")
+    options = {
+        "script": script,
+        "prof": os.path.join(directory, f"{run_id}.prof"),
+        "report": report_path,
+        "top": top,
+        "sort_by": sort_by,
+        "trace_memory": trace_memory,
+    }
+    with open(script, "w") as f:
+        f.write(code)
+    try:
+        result = run_sandboxed(
+            [sys.executable, _WORKER, json.dumps(options)], registry, limits, timeout, cwd=cwd
+        )
+        try:
+            with open(report_path) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            output = (result.stdout + result.stderr).strip()[-2000:]
+            raise RuntimeError(
+                f"the profiler exited with code {result.returncode} before reporting:\n{output}"
+            )
+    finally:
+        for path in (script, report_path):
+            if os.path.exists(path):
+                os.unlink(path)
+    _prune(directory, keep_profiles)
+    report["prof"] = options["prof"]
+    return report, result
+
+
+def format_profile(report: dict) -> str:
+    """Render a profile report as a hotspot table, peak memory and top allocation sites."""
+    header = f"Profile · {report['wall']:.3f}s wall · {report['total_calls']:,} function calls"
+    if report["peak_memory"] is not None:
+        header += f" · peak traced memory {report['peak_memory'] / 1024**2:.1f} MB"
+    lines = [header, "", f"{'ncalls':>12} {'tottime':>9} {'cumtime':>9}  function"]
+    for entry in report["entries"]:
+        calls = str(entry["calls"])
+        if entry["primitive_calls"] != entry["calls"]:
+            calls = f"{entry['calls']}/{entry['primitive_calls']}"  # recursive
+        lines.append(
+            f"{calls:>12} {entry['tottime']:>9.4f} {entry['cumtime']:>9.4f}  {entry['function']}"
+        )
+
+    if report["allocations"]:
+        lines += ["", "Top allocation sites (live at the end):"]
+        lines += [
+            f"  {a['where']} · {a['size'] / 1024:.1f} KB in {a['count']} blocks"
+            for a in report["allocations"]
+        ]
+    lines += ["", f"Full profile: {report['prof']} (load with pstats.Stats)"]
+    return "\n".join(lines)
@@ -0,0 +1,128 @@
+"""Profiling worker: runs a script under cProfile and tracemalloc and writes a JSON report.
+
+Usage: python profiling_worker.py '<json options>'
+
+Options: script (path of the code to run), prof (where to dump the full
+pstats profile), report (path of the JSON report), top, sort_by
+("cumulative" or "tottime") and trace_memory. Kept free of app imports, it
+runs with the workspace as cwd.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import runpy
+import sys
+import time
+import traceback
+import tracemalloc
+
+
+def _label(filename: str, line: int, name: str, script: str) -> str:
+    if filename == "~":
+        return name  # builtins, e.g. <built-in method time.sleep>
+    if filename == script:
+        filename = "<code>"
+    elif filename.startswith(os.getcwd() + os.sep):
+        filename = os.path.relpath(filename)
+    else:
+        # library code: the last two path parts are enough to place it
+        filename = os.sep.join(filename.split(os.sep)[-2:])
+    return f"{filename}:{line}({name})"
+
+
+def main():
+    options = json.loads(sys.argv[1])
+    script = options["script"]
+    sys.path.insert(0, os.getcwd())
+    sys.argv = [script]
+
+    if options.get("trace_memory", True):
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    raised = None
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except BaseException as e:
+        raised = e
+    profiler.disable()
+    wall = time.perf_counter() - started
+    sys.stdout.flush()
+
+    peak_memory = None
+    allocations = []
+    if tracemalloc.is_tracing():
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen *>"),
+                tracemalloc.Filter(False, runpy.__file__),
+                tracemalloc.Filter(False, "*/pkgutil.py"),  # runpy's import machinery
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+        for stat in snapshot.statistics("lineno")[:5]:
+            frame = stat.traceback[0]
+            allocations.append(
+                {
+                    "where": _label(frame.filename, frame.lineno, "", script).rstrip("()"),
+                    "size": stat.size,
+                    "count": stat.count,
+                }
+            )
+        tracemalloc.stop()
+
+    error = None
+    if isinstance(raised, SystemExit):
+        if raised.code not in (None, 0):
+            error = f"SystemExit: {raised.code}"
+    elif raised is not None:
+        frames = traceback.extract_tb(raised.__traceback__)
+        # start at the snippet, the worker and runpy frames are noise
+        while frames and frames[0].filename != script:
+            frames.pop(0)
+        lines = traceback.format_list(frames) + traceback.format_exception_only(raised)
+        error = "Traceback (most recent call last):\n" + "".join(lines).replace(script, "<code>")
+
+    profiler.dump_stats(options["prof"])
+    stats = pstats.Stats(profiler)
+    entries = []
+    for (filename, line, name), (primitive, calls, tottime, cumtime, _) in stats.stats.items():
+        # runpy's frames wrap the whole snippet and say nothing about it
+        if "runpy" in filename or name in (
+            "<built-in method builtins.exec>",
+            "<method 'disable' of '_lsprof.Profiler' objects>",
+        ):
+            continue
+        entries.append(
+            {
+                "function": _label(filename, line, name, script),
+                "calls": calls,
+                "primitive_calls": primitive,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            }
+        )
+    key = "tottime" if options.get("sort_by") == "tottime" else "cumtime"
+    entries.sort(key=lambda entry: entry[key], reverse=True)
+
+    with open(options["report"], "w") as f:
+        json.dump(
+            {
+                "wall": wall,
+                "total_calls": stats.total_calls,
+                "entries": entries[: options.get("top", 15)],
+                "peak_memory": peak_memory,
+                "allocations": allocations,
+                "error": error,
+            },
+            f,
+        )
+
+
+if __name__ == "__main__":
+    main()
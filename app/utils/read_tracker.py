@@ -0,0 +1,84 @@
+import difflib
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ReadTracker:
+    """Remembers, per thread, which version of each file was sent to the model.
+
+    A repeat read of an unchanged file collapses to a short note and a read
+    of a changed file to a unified diff against the version the model last
+    saw, so verification loops stop paying for whole files.
+    """
+
+    def __init__(self, max_files_per_thread: int = 500):
+        self.max_files_per_thread = max_files_per_thread
+        self._lock = threading.Lock()
+        self._seen = {}  # thread id -> OrderedDict(path -> (digest, turn, content))
+        self._turns = {}  # thread id -> current turn number
+
+    def begin_turn(self, thread_id: str):
+        with self._lock:
+            self._turns[thread_id] = self._turns.get(thread_id, 0) + 1
+
+    def forget_thread(self, thread_id: str):
+        with self._lock:
+            self._seen.pop(thread_id, None)
+            self._turns.pop(thread_id, None)
+
+    def render(
+        self, thread_id: str | None, path: str, content: str, full: bool = False
+    ) -> tuple:
+        """Return (what the model should get for this read, the read to commit).
+
+        Nothing is remembered yet: the read only counts as seen once ``commit``
+        is called for it, when its result really reaches the model. A
+        speculative or cancelled read therefore never hides the content from
+        the next one.
+        """
+        if thread_id is None:
+            return content, None
+
+        digest = hashlib.sha256(content.encode("utf-8", "replace")).hexdigest()
+        read = (thread_id, path, digest, content, full)
+        with self._lock:
+            previous = self._seen.get(thread_id, {}).get(path)
+
+        if full or previous is None:
+            return content, read
+
+        seen_digest, seen_turn, seen_content = previous
+        if seen_digest == digest:
+            return (
+                f"[{path} is unchanged since you read it in turn {seen_turn}. "
+                f"Call read_file with full=True if you need the content again.]"
+            ), read
+
+        diff = "".join(
+            difflib.unified_diff(
+                seen_content.splitlines(keepends=True),
+                content.splitlines(keepends=True),
+                fromfile=f"{path} (turn {seen_turn})",
+                tofile=f"{path} (now)",
+            )
+        )
+        if len(diff) >= len(content):
+            return content, read
+        return (
+            f"[{path} changed since you read it in turn {seen_turn}. Unified diff against that "
+            f"version below; call read_file with full=True for the whole file.]\n{diff}"
+        ), read
+
+    def commit(self, read: tuple):
+        """Remember a read returned by ``render`` as seen by the model."""
+        thread_id, path, digest, content, full = read
+        with self._lock:
+            turn = self._turns.get(thread_id, 0)
+            files = self._seen.setdefault(thread_id, OrderedDict())
+            previous = files.pop(path, None)
+            # an unchanged re-read keeps pointing at the turn the content was really sent
+            unchanged = previous is not None and previous[0] == digest and not full
+            files[path] = (digest, previous[1] if unchanged else turn, content)
+            while len(files) > self.max_files_per_thread:
+                files.popitem(last=False)
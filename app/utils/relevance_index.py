@@ -0,0 +1,198 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from app.utils.files import is_binary_file, is_workspace_file, iter_workspace_files
+from app.utils.spill_store import estimate_tokens
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please", "self",
+    "that", "the", "this", "to", "we", "what", "with", "you",
+}
+
+
+def tokenize(text: str) -> list:
+    """Split text into lowercase terms, expanding snake_case and camelCase identifiers."""
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lowered = word.lower()
+        if lowered not in _STOPWORDS and len(lowered) > 1:
+            terms.append(lowered)
+        parts = [p for part in word.split("_") for p in _CAMEL_RE.findall(part)]
+        if len(parts) > 1:
+            terms.extend(
+                p.lower() for p in parts if len(p) > 1 and p.lower() not in _STOPWORDS
+            )
+    return terms
+
+
+class RelevanceIndex:
+    """Offline BM25 index over workspace file chunks.
+
+    The index is built on first use and then kept fresh incrementally: files
+    reported by the write tools are re-indexed before the next query, and a
+    cheap stat-only rescan picks up changes made by other means.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        chunk_lines: int = 40,
+        rescan_interval: float = 30.0,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.root = os.path.abspath(root) if root else None
+        self.chunk_lines = chunk_lines
+        self.rescan_interval = rescan_interval
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._files = {}  # path -> (mtime_ns, size, [chunk ids])
+        self._chunks = {}  # chunk id -> (path, start, end, text, length)
+        self._postings = {}  # term -> {chunk id: term frequency}
+        self._total_length = 0
+        self._next_id = 0
+        self._dirty = set()
+        self._last_scan = None
+
+    def mark_dirty(self, path: str):
+        """Queue a file for re-indexing before the next query; files outside the root are ignored."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if self.root is None or path.startswith(self.root + os.sep):
+                self._dirty.add(path)
+
+    def refresh(self, force: bool = False):
+        """Bring the index up to date with the workspace."""
+        with self._lock:
+            if self.root is None:
+                self.root = os.getcwd()
+            now = time.monotonic()
+            if (
+                force
+                or self._last_scan is None
+                or now - self._last_scan >= self.rescan_interval
+            ):
+                self._rescan()
+                self._last_scan = now
+                self._dirty.clear()
+                return
+            for path in self._dirty:
+                self._remove_file(path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                # the same files the full rescan would pick up
+                if is_workspace_file(path, st, self.root):
+                    self._add_file(path, st)
+            self._dirty.clear()
+
+    def _rescan(self):
+        seen = set()
+        for path, st in iter_workspace_files(self.root):
+            seen.add(path)
+            known = self._files.get(path)
+            if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+                continue
+            self._remove_file(path)
+            self._add_file(path, st)
+        for path in [p for p in self._files if p not in seen]:
+            self._remove_file(path)
+
+    def _add_file(self, path: str, st):
+        if is_binary_file(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+
+        path_terms = tokenize(os.path.relpath(path, self.root))
+        chunk_ids = []
+        for start in range(0, max(len(lines), 1), self.chunk_lines):
+            text = "\n".join(lines[start : start + self.chunk_lines])
+            terms = Counter(tokenize(text) + path_terms)
+            if not terms:
+                continue
+            chunk_id = self._next_id
+            self._next_id += 1
+            length = sum(terms.values())
+            self._chunks[chunk_id] = (
+                path,
+                start + 1,
+                min(start + self.chunk_lines, len(lines)),
+                text,
+                length,
+            )
+            self._total_length += length
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = tf
+            chunk_ids.append(chunk_id)
+        self._files[path] = (st.st_mtime_ns, st.st_size, chunk_ids)
+
+    def _remove_file(self, path: str):
+        known = self._files.pop(path, None)
+        if not known:
+            return
+        for chunk_id in known[2]:
+            _, _, _, text, length = self._chunks.pop(chunk_id)
+            self._total_length -= length
+            for term in set(tokenize(text)) | set(tokenize(os.path.relpath(path, self.root))):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Return up to k (score, path, start_line, end_line, text) tuples, best first."""
+        self.refresh()
+        with self._lock:
+            n = len(self._chunks)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores = Counter()
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    length = self._chunks[chunk_id][4]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            return [
+                (score, *self._chunks[chunk_id][:4])
+                for chunk_id, score in scores.most_common(k)
+            ]
+
+    def context_for(self, query: str, budget_tokens: int = 1500, k: int = 8) -> str:
+        """Format the best matching chunks for a query within a token budget."""
+        sections = []
+        used = 0
+        for _, path, start, end, text in self.search(query, k=k):
+            section = f"--- {os.path.relpath(path, self.root)} (lines {start}-{end}) ---\n{text}"
+            cost = estimate_tokens(section)
+            if used + cost > budget_tokens:
+                continue
+            sections.append(section)
+            used += cost
+        if not sections:
+            return ""
+        return (
+            "Relevant workspace context (retrieved automatically, may be incomplete):\n\n"
+            + "\n\n".join(sections)
+        )
@@ -0,0 +1,249 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import uuid
+from app.utils.processes import ProcessRegistry, kill_process_group
+
+_LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_exec.py")
+_CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+class SandboxLimits:
+    """Per-execution resource limits for tool subprocesses.
+
+    ``processes`` maps to RLIMIT_NPROC, which counts every process of the
+    user, and is ignored for root; the cgroup ``pids.max`` is the precise
+    limit where cgroup v2 is usable.
+    """
+
+    def __init__(
+        self,
+        cpu_seconds: int | None = 300,
+        memory_bytes: int | None = 4 * 1024**3,
+        open_files: int | None = 1024,
+        processes: int | None = 512,
+        output_bytes: int = 1024 * 1024,
+        use_cgroups: bool = True,
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.open_files = open_files
+        self.processes = processes
+        self.output_bytes = output_bytes
+        self.use_cgroups = use_cgroups
+
+
+class SandboxResult(subprocess.CompletedProcess):
+    """CompletedProcess with the resource usage of the sandboxed run."""
+
+    def __init__(self, args, returncode, stdout, stderr, peak_rss_bytes, cpu_seconds, truncated):
+        super().__init__(args, returncode, stdout, stderr)
+        self.peak_rss_bytes = peak_rss_bytes
+        self.cpu_seconds = cpu_seconds
+        self.truncated = truncated
+
+    def usage_summary(self) -> str:
+        summary = f"Resources: peak RSS {self.peak_rss_bytes / 1024**2:.1f} MB · CPU {self.cpu_seconds:.2f}s"
+        if self.truncated:
+            summary += " · output truncated"
+        if self.returncode == -signal.SIGXCPU or self.returncode == -signal.SIGKILL:
+            summary += f" · killed by signal {signal.Signals(-self.returncode).name}"
+        return summary
+
+
+def _own_cgroup() -> str | None:
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return os.path.join(_CGROUP_ROOT, line[3:].strip().lstrip("/"))
+    except OSError:
+        pass
+    return None
+
+
+def _create_cgroup(limits: SandboxLimits) -> str | None:
+    """Create a child cgroup v2 for one run, or None when cgroups are not usable."""
+    if not limits.use_cgroups or not os.path.exists(os.path.join(_CGROUP_ROOT, "cgroup.controllers")):
+        return None
+    parent = _own_cgroup()
+    if parent is None:
+        return None
+    path = os.path.join(parent, f"projectx-{uuid.uuid4().hex[:12]}")
+    try:
+        os.mkdir(path)
+    except OSError:
+        return None
+    for name, value in (("memory.max", limits.memory_bytes), ("pids.max", limits.processes)):
+        if value is None:
+            continue
+        try:
+            with open(os.path.join(path, name), "w") as f:
+                f.write(str(value))
+        except OSError:
+            pass  # controller not delegated to us, the rlimits still apply
+    return path
+
+
+def _read_cgroup_usage(path: str) -> tuple:
+    peak = cpu = None
+    try:
+        with open(os.path.join(path, "memory.peak")) as f:
+            peak = int(f.read())
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(path, "cpu.stat")) as f:
+            for line in f:
+                if line.startswith("usage_usec"):
+                    cpu = int(line.split()[1]) / 1e6
+    except (OSError, ValueError):
+        pass
+    return peak, cpu
+
+
+def _remove_cgroup(path: str):
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+
+def _drain(stream, limit: int, chunks: list, truncated: list):
+    size = 0
+    for block in iter(lambda: stream.read(65536), b""):
+        if size < limit:
+            chunks.append(block[: limit - size])
+        # also once the limit was reached exactly on a block boundary
+        if size + len(block) > limit and not truncated:
+            truncated.append(True)
+        size += len(block)
+    stream.close()
+
+
+def spawn_sandboxed(
+    args,
+    limits: SandboxLimits,
+    shell: bool = False,
+    cwd: str | None = None,
+    stderr=subprocess.PIPE,
+    stdin=subprocess.DEVNULL,
+) -> tuple:
+    """Start a command through the launcher in its own session without waiting for it.
+
+    Returns (proc, status_fd, cgroup): the launcher writes the command's
+    resource usage as JSON to status_fd when it exits, and the cgroup (or
+    None) is left for the caller to read and remove.
+    """
+    argv = ["/bin/sh", "-c", args] if shell else list(args)
+    cgroup = _create_cgroup(limits)
+    status_read, status_write = os.pipe()
+    launcher_limits = {
+        "cpu_seconds": limits.cpu_seconds,
+        "memory_bytes": limits.memory_bytes,
+        "open_files": limits.open_files,
+        "processes": limits.processes,
+        "cgroup": cgroup,
+        "status_fd": status_write,
+    }
+
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, _LAUNCHER, json.dumps(launcher_limits), "--", *argv],
+            stdin=stdin,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            cwd=cwd,
+            start_new_session=True,
+            pass_fds=(status_write,),
+        )
+    except BaseException:
+        os.close(status_read)
+        if cgroup:
+            _remove_cgroup(cgroup)
+        raise
+    finally:
+        os.close(status_write)
+    return proc, status_read, cgroup
+
+
+def collect_usage(report: bytes, cgroup: str | None) -> tuple:
+    """Return (peak_rss_bytes, cpu_seconds) from a launcher report, preferring the cgroup's figures."""
+    try:
+        report = json.loads(report)
+    except ValueError:
+        report = {"maxrss_kb": 0, "cpu_seconds": 0.0}  # launcher killed before reporting
+    peak_rss = report["maxrss_kb"] * 1024  # kilobytes on linux
+    cpu_seconds = report["cpu_seconds"]
+    if cgroup:
+        group_peak, group_cpu = _read_cgroup_usage(cgroup)
+        peak_rss = group_peak or peak_rss
+        cpu_seconds = group_cpu if group_cpu is not None else cpu_seconds
+        _remove_cgroup(cgroup)
+    return peak_rss, cpu_seconds
+
+
+def run_sandboxed(
+    args,
+    registry: ProcessRegistry,
+    limits: SandboxLimits,
+    timeout: float,
+    shell: bool = False,
+    cwd: str | None = None,
+) -> SandboxResult:
+    """Run a command under rlimits (and a cgroup when possible) in its own session.
+
+    The process group is registered for cancellation and killed as a whole on
+    timeout. Raises subprocess.TimeoutExpired like subprocess.run.
+    """
+    proc, status_read, cgroup = spawn_sandboxed(args, limits, shell=shell, cwd=cwd)
+    registry.register(proc)
+
+    stdout, stderr, truncated = [], [], []
+    readers = [
+        threading.Thread(target=_drain, args=(proc.stdout, limits.output_bytes, stdout, truncated), daemon=True),
+        threading.Thread(target=_drain, args=(proc.stderr, limits.output_bytes, stderr, truncated), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = []
+
+    def on_timeout():
+        timed_out.append(True)
+        kill_process_group(proc)
+
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+    try:
+        with os.fdopen(status_read, "rb") as status:
+            report = status.read()
+        proc.wait()
+        # children that kept the pipes open die with the group
+        kill_process_group(proc)
+        for reader in readers:
+            reader.join()
+    except BaseException:
+        kill_process_group(proc)
+        raise
+    finally:
+        timer.cancel()
+        registry.unregister(proc)
+
+    peak_rss, cpu_seconds = collect_usage(report, cgroup)
+
+    if timed_out:
+        raise subprocess.TimeoutExpired(args, timeout)
+
+    return SandboxResult(
+        args,
+        proc.returncode,
+        b"".join(stdout).decode("utf-8", "replace"),
+        b"".join(stderr).decode("utf-8", "replace"),
+        peak_rss,
+        cpu_seconds,
+        bool(truncated),
+    )
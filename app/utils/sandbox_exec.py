@@ -0,0 +1,87 @@
+"""Launcher that applies sandbox limits and runs the real command as its child.
+
+Run as ``python sandbox_exec.py '<limits json>' -- argv...``. It is a separate
+script rather than a preexec_fn because tools run in worker threads, where
+forking into arbitrary Python code is unsafe. It must not import the app package.
+"""
+
+import json
+import os
+import resource
+import signal
+import sys
+
+
+def _set_limit(name: str, soft, hard=None):
+    if soft is None or not hasattr(resource, name):
+        return
+    limit = getattr(resource, name)
+    hard = soft if hard is None else hard
+    _, current_hard = resource.getrlimit(limit)
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    try:
+        resource.setrlimit(limit, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def main():
+    limits = json.loads(sys.argv[1])
+    argv = sys.argv[sys.argv.index("--") + 1 :]
+
+    if limits.get("cgroup"):
+        try:
+            with open(os.path.join(limits["cgroup"], "cgroup.procs"), "w") as f:
+                f.write(str(os.getpid()))
+        except OSError:
+            pass
+
+    # soft CPU limit delivers SIGXCPU first, the hard one a second later kills
+    cpu_seconds = limits.get("cpu_seconds")
+    _set_limit("RLIMIT_CPU", cpu_seconds, cpu_seconds and cpu_seconds + 1)
+    _set_limit("RLIMIT_AS", limits.get("memory_bytes"))
+    _set_limit("RLIMIT_NOFILE", limits.get("open_files"))
+    _set_limit("RLIMIT_NPROC", limits.get("processes"))
+
+    status_fd = limits.get("status_fd")
+    if status_fd is not None:
+        # the command must not hold the status pipe open
+        os.set_inheritable(status_fd, False)
+
+    # fork from this small process rather than exec'ing in place: a child
+    # inherits the RSS high-water mark of whoever forked it, and the agent's
+    # would otherwise be reported as the command's peak
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(argv[0], argv)
+        except OSError as e:
+            sys.stderr.write(f"sandbox: cannot execute {argv[0]}: {e}\n")
+            os._exit(127)
+
+    # a SIGINT to the process group is meant for the command, the launcher only waits
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            _, status, usage = os.wait4(pid, 0)
+            break
+        except InterruptedError:
+            continue
+
+    if status_fd is not None:
+        report = {"maxrss_kb": usage.ru_maxrss, "cpu_seconds": usage.ru_utime + usage.ru_stime}
+        os.write(status_fd, json.dumps(report).encode())
+        os.close(status_fd)
+
+    code = os.waitstatus_to_exitcode(status)
+    if code < 0:
+        # mirror the child's death so the caller sees the same signal
+        if -code != signal.SIGKILL:  # its disposition cannot be changed, nor needs to be
+            signal.signal(-code, signal.SIG_DFL)
+        os.kill(os.getpid(), -code)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
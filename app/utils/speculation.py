@@ -0,0 +1,142 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from app.utils.metrics import metrics
+
+
+class _Message:
+    """Speculation state for the message a thread's model is streaming."""
+
+    def __init__(self, config=None):
+        self.config = config
+        self.pending = {}  # stream index -> (name, args, future)
+        self.ready = {}  # tool_call_id -> future
+        self.blocked = False
+
+
+class SpeculativeExecutor:
+    """Runs read-only tool calls while the model is still streaming its message.
+
+    ``observe`` is fed the accumulated chunk after every streamed piece and
+    starts each leading read-only call as soon as its arguments parse and
+    validate. ``finish`` matches the speculations against the final message,
+    and the tools node collects the results with ``take``. Anything the final
+    message does not confirm is cancelled or discarded. State is kept per
+    thread, so threads streaming at the same time do not cancel each other.
+    Pass a shared ``pool`` when executors are rebuilt, so their worker
+    threads are not left behind.
+    """
+
+    def __init__(
+        self,
+        tools: list,
+        read_only: set,
+        max_workers: int = 4,
+        pool: ThreadPoolExecutor | None = None,
+    ):
+        self.tools = {t.name: t for t in tools if t.name in read_only}
+        self._pool = pool or ThreadPoolExecutor(max_workers, thread_name_prefix="speculate")
+        self._lock = threading.Lock()
+        self._messages = {}  # thread_id -> _Message
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+
+    def begin(self, thread_id: str, config=None):
+        """Reset a thread's state before its next LLM call starts streaming."""
+        with self._lock:
+            previous = self._messages.get(thread_id)
+            if previous is not None:
+                self._discard(f for _, _, f in previous.pending.values())
+                self._discard(previous.ready.values())
+            self._messages[thread_id] = _Message(config)
+
+    def observe(self, thread_id: str, message: AIMessageChunk):
+        """Start every read-only call whose arguments are complete so far."""
+        state = self._messages.get(thread_id)
+        if state is None or state.blocked or not self.tools:
+            return
+        for chunk in sorted(message.tool_call_chunks, key=lambda c: c.get("index") or 0):
+            index = chunk.get("index") or 0
+            if index in state.pending:
+                continue
+
+            tool = self.tools.get(chunk.get("name"))
+            if tool is None:
+                # a call with side effects comes first, later reads must wait for it
+                state.blocked = bool(chunk.get("name"))
+                return
+
+            args = _complete_args(chunk.get("args"))
+            if args is None:
+                return
+            try:
+                tool.tool_call_schema.model_validate(args)
+            except Exception:
+                state.blocked = True
+                return
+
+            call = {"type": "tool_call", "name": tool.name, "args": args, "id": chunk.get("id")}
+            with self._lock:
+                state.pending[index] = (
+                    tool.name,
+                    args,
+                    self._pool.submit(tool.invoke, call, state.config),
+                )
+                self.started += 1
+                metrics.incr("speculation.started")
+
+    def finish(self, thread_id: str, message: AIMessage):
+        """Keep the speculations the final message confirms, drop the rest."""
+        with self._lock:
+            state = self._messages.get(thread_id)
+            if state is None:
+                return
+            for index, (name, args, future) in state.pending.items():
+                calls = message.tool_calls
+                if index < len(calls) and calls[index]["name"] == name and calls[index]["args"] == args:
+                    state.ready[calls[index]["id"]] = future
+                else:
+                    self._discard([future])
+            state.pending = {}
+            if not state.ready:
+                del self._messages[thread_id]
+
+    def take(self, thread_id: str, tool_call_id: str) -> ToolMessage | None:
+        """Return the speculative result for a confirmed call, if it succeeded."""
+        with self._lock:
+            state = self._messages.get(thread_id)
+            if state is None:
+                return None
+            future = state.ready.pop(tool_call_id, None)
+            if not state.ready:
+                del self._messages[thread_id]
+        if future is None:
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            return None
+        if not isinstance(result, ToolMessage):
+            return None
+        self.used += 1
+        metrics.incr("speculation.used")
+        return result.model_copy(update={"tool_call_id": tool_call_id})
+
+    def _discard(self, futures):
+        for future in futures:
+            future.cancel()
+            self.discarded += 1
+            metrics.incr("speculation.discarded")
+
+
+def _complete_args(raw: str | None) -> dict | None:
+    """Parse streamed arguments, or None while the JSON object is still open."""
+    if not raw:
+        return None
+    try:
+        args = json.loads(raw)
+    except ValueError:
+        return None
+    return args if isinstance(args, dict) else None
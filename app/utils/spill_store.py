@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+from app.utils.cache import cache_dir
+
+# rough chars-per-token ratio, good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+MAX_PAGE_CHARS = 8000
+
+_HANDLE_RE = re.compile(r"^[0-9a-f]{16}$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for context budgeting."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class SpillStore:
+    """Content-addressed on-disk store for tool outputs too large for the history."""
+
+    def __init__(self, directory: str | None = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        # resolved lazily so importing the tools never touches the filesystem
+        if self._directory is None:
+            self._directory = cache_dir("spill")
+        return self._directory
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.txt")
+
+    def put(self, content: str) -> str:
+        """Store content and return its handle. Identical outputs share one entry."""
+        handle = hashlib.sha256(content.encode("utf-8", "replace")).hexdigest()[:16]
+        path = self._path(handle)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", errors="replace") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return handle
+
+    def get(self, handle: str) -> str | None:
+        """Return the stored content for a handle, or None if unknown."""
+        handle = handle.strip()
+        if not _HANDLE_RE.match(handle):
+            return None
+        try:
+            with open(self._path(handle), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class ToolResultPolicy:
+    """Caps tool results kept in the message history.
+
+    Outputs over ``max_tokens`` are spilled to the store and replaced by a
+    head/tail excerpt plus a handle the model can page through with
+    ``fetch_output``.
+    """
+
+    def __init__(
+        self,
+        store: SpillStore,
+        max_tokens: int = 2000,
+        exempt_tools: tuple = ("fetch_output",),
+    ):
+        self.store = store
+        self.max_tokens = max_tokens
+        self.exempt_tools = set(exempt_tools)
+
+    def apply(self, tool_name: str, content):
+        if (
+            tool_name in self.exempt_tools
+            or not isinstance(content, str)
+            or estimate_tokens(content) <= self.max_tokens
+        ):
+            return content
+
+        handle = self.store.put(content)
+        budget_chars = self.max_tokens * CHARS_PER_TOKEN
+        head = _cut_at_line(content[: budget_chars * 3 // 5], keep="head")
+        tail = _cut_at_line(content[-(budget_chars * 3 // 10) :], keep="tail")
+        omitted_start = len(head)
+        omitted = len(content) - len(head) - len(tail)
+
+        return (
+            f"{head}\n\n"
+            f"[... {omitted} characters omitted. Full output is {len(content)} characters "
+            f"(~{estimate_tokens(content)} tokens), stored as handle '{handle}'. "
+            f'Use fetch_output(handle="{handle}", start={omitted_start}) to read the rest ...]\n\n'
+            f"{tail}"
+        )
+
+
+def _cut_at_line(text: str, keep: str) -> str:
+    """Trim a slice to whole lines when a line break is reasonably close."""
+    if keep == "head":
+        cut = text.rfind("\n")
+        return text[:cut] if cut > len(text) // 2 else text
+    cut = text.find("\n")
+    return text[cut + 1 :] if -1 < cut < len(text) // 2 else text
@@ -0,0 +1,135 @@
+import ast
+import difflib
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+# name is qualified ("Class.method"); start includes decorators, both lines are 1-based
+Symbol = namedtuple("Symbol", "name kind start end indent signature doc")
+
+
+def _signature(node) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(b) for b in node.bases] + [ast.unparse(k) for k in node.keywords]
+        return f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _collect(body, parent: str, in_class: bool, symbols: list):
+    for node in body:
+        if not isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        name = f"{parent}.{node.name}" if parent else node.name
+        if isinstance(node, ast.ClassDef):
+            kind = "class"
+        else:
+            kind = "method" if in_class else "function"
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        doc = (ast.get_docstring(node) or "").strip().splitlines()
+        symbols.append(
+            Symbol(
+                name,
+                kind,
+                start,
+                node.end_lineno,
+                node.col_offset,
+                _signature(node),
+                doc[0] if doc else "",
+            )
+        )
+        # functions nested in functions are implementation details, not part of the outline
+        if isinstance(node, ast.ClassDef):
+            _collect(node.body, name, True, symbols)
+
+
+def parse_symbols(source: bytes, filename: str = "<unknown>") -> list:
+    """Parse Python source into its symbols. Raises SyntaxError."""
+    symbols = []
+    _collect(ast.parse(source, filename=filename).body, "", False, symbols)
+    return symbols
+
+
+def format_outline(symbols: list, line_numbers: bool = True) -> list:
+    """One line per symbol, nested by qualified name, with the first docstring line."""
+    lines = []
+    for symbol in symbols:
+        depth = symbol.name.count(".")
+        doc = f"  # {symbol.doc}" if symbol.doc else ""
+        span = f"{symbol.start:>5}-{symbol.end:<5} " if line_numbers else ""
+        lines.append(f"{span}{'    ' * depth}{symbol.signature}{doc}")
+    return lines
+
+
+class SymbolIndex:
+    """Classes, functions and methods of Python files with their line spans.
+
+    Entries are validated by (mtime, size) on access and re-parsed only when
+    the content hash changed too; the write tools flag the files they touch
+    through ``mark_dirty``.
+    """
+
+    def __init__(self, max_files: int = 2000):
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._files = {}  # path -> (mtime_ns, size, digest, [Symbol])
+
+    def mark_dirty(self, path: str):
+        """Force a re-check of a file; its symbols are reused if the content hash is unchanged."""
+        path = os.path.abspath(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None:
+                self._files[path] = (None, None, cached[2], cached[3])
+
+    def symbols(self, path: str) -> list:
+        """Return the symbols of a file. Raises OSError or SyntaxError."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[3]
+
+        with open(path, "rb") as f:
+            source = f.read()
+        digest = hashlib.sha256(source).hexdigest()
+        if cached is not None and cached[2] == digest:
+            symbols = cached[3]  # touched but unchanged
+        else:
+            symbols = parse_symbols(source, path)
+
+        with self._lock:
+            if len(self._files) >= self.max_files:
+                self._files.pop(next(iter(self._files)))
+            self._files[path] = (st.st_mtime_ns, st.st_size, digest, symbols)
+        return symbols
+
+    def find(self, path: str, name: str) -> Symbol:
+        """Look a symbol up by qualified name, or "name:line" to pick one of several definitions.
+
+        Raises LookupError with a readable message when it is missing or ambiguous.
+        """
+        line = None
+        if ":" in name and name.rsplit(":", 1)[1].isdigit():
+            name, line = name.rsplit(":", 1)
+            line = int(line)
+        symbols = self.symbols(path)
+        exact = [s for s in symbols if s.name == name]
+        # a bare method name is fine when it is unique in the file
+        bare = [s for s in symbols if s.name.rsplit(".", 1)[-1] == name]
+        if line is not None:
+            exact = [s for s in exact if s.start <= line <= s.end]
+            bare = [s for s in bare if s.start <= line <= s.end]
+        matches = exact or bare
+
+        if len(matches) == 1:
+            return matches[0]
+        if not matches:
+            close = difflib.get_close_matches(name, [s.name for s in symbols], n=5)
+            hint = f" Did you mean: {', '.join(close)}?" if close else ""
+            raise LookupError(f"No symbol '{name}' in {path}.{hint}")
+        spans = ", ".join(f"{s.name}:{s.start}" for s in matches)
+        raise LookupError(f"'{name}' is defined {len(matches)} times in {path}; use one of: {spans}")
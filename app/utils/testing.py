@@ -0,0 +1,294 @@
+import ast
+import configparser
+import fnmatch
+import json
+import os
+import sys
+import tempfile
+import threading
+from app.utils.cache import cache_dir
+from app.utils.files import iter_workspace_files
+from app.utils.processes import ProcessRegistry
+from app.utils.sandbox import SandboxLimits, run_sandboxed
+
+_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testing_worker.py")
+
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py")
+
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in TEST_FILE_PATTERNS)
+
+
+def _module_name(rel_path: str) -> str:
+    parts = os.path.splitext(rel_path)[0].split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def _package_roots(root: str) -> list:
+    """Directories imports resolve against: the root, src/ and pytest's configured pythonpath."""
+    entries = ["src"]
+    try:
+        import tomllib
+
+        with open(os.path.join(root, "pyproject.toml"), "rb") as f:
+            options = tomllib.load(f).get("tool", {}).get("pytest", {}).get("ini_options", {})
+        paths = options.get("pythonpath", [])
+        entries += [paths] if isinstance(paths, str) else list(paths)
+    except (ImportError, OSError, ValueError, AttributeError):
+        pass
+    ini_files = (("pytest.ini", "pytest"), ("setup.cfg", "tool:pytest"), ("tox.ini", "pytest"))
+    for name, section in ini_files:
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(os.path.join(root, name))
+            entries += parser.get(section, "pythonpath", fallback="").split()
+        except configparser.Error:
+            pass
+    roots = [root]
+    for entry in entries:
+        path = os.path.normpath(os.path.join(root, entry))
+        if os.path.isdir(path) and path not in roots:
+            roots.append(path)
+    # the deepest root names a module first
+    return sorted(roots, key=len, reverse=True)
+
+
+def _imported_modules(path: str, module: str, is_package: bool) -> set:
+    """Absolute dotted names a file imports, including `from x import y` as x.y."""
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError, ValueError):
+        return set()
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                package = module.split(".") if is_package else module.split(".")[:-1]
+                package = package[: len(package) - node.level + 1]
+                base = ".".join(filter(None, [*package, base]))
+            names.add(base)
+            names.update(f"{base}.{alias.name}" for alias in node.names if alias.name != "*")
+    return names
+
+
+class TestSelector:
+    """Selects the test files affected by the Python files changed since they last ran.
+
+    A file-level import graph of the workspace is kept up to date from
+    (mtime, size) signatures. Imports resolve against the package roots
+    (the workspace, src/ and pytest's pythonpath) and the importing file's
+    directory. Each test file remembers the signatures of everything it
+    imports, directly or transitively, and of the conftest.py files above
+    it, when it last ran; it is selected again when one of them changed,
+    when it never ran, or when it failed last time. A test whose imports
+    name a workspace package that does not resolve always runs, rather
+    than never.
+    """
+
+    __test__ = False  # not a pytest test class
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._root = None
+        self._roots = None
+        self._imports = {}  # path -> (signature, [imported paths], has unresolved project imports)
+        self._ran = {}  # test path -> {dependency path: signature} at its last run
+        self._failing = set()
+
+    def _scan(self, root: str) -> dict:
+        """Return {path: signature} for the Python files under root, refreshing the graph."""
+        if root != self._root:
+            self._root, self._imports, self._ran, self._failing = root, {}, {}, set()
+        roots = _package_roots(root)
+        if roots != self._roots:
+            self._roots, self._imports = roots, {}
+
+        signatures = {
+            path: (st.st_mtime_ns, st.st_size)
+            for path, st in iter_workspace_files(root, max_files=20000)
+            if path.endswith(".py")
+        }
+        modules = {}
+        names = {}
+        for path in signatures:
+            for package_root in roots:
+                if path.startswith(package_root + os.sep):
+                    module = _module_name(os.path.relpath(path, package_root))
+                    modules.setdefault(module, path)
+                    names.setdefault(path, module)
+        # top-level names of the workspace's own packages, wherever they live
+        packages = {os.path.dirname(p) for p in signatures if os.path.basename(p) == "__init__.py"}
+        project = {
+            os.path.basename(package)
+            for package in packages
+            if os.path.dirname(package) not in packages
+        }
+
+        for path, signature in signatures.items():
+            cached = self._imports.get(path)
+            if cached is not None and cached[0] == signature:
+                continue
+            module = names[path]
+            imported = _imported_modules(path, module, path.endswith("__init__.py"))
+            local = os.path.dirname(path)
+            targets = set()
+            unresolved = False
+            for name in imported:
+                parts = name.split(".")
+                # a sibling module, importable from the file's own directory under pytest
+                sibling = os.path.join(local, parts[0] + ".py")
+                if parts[0] not in modules and sibling in signatures:
+                    targets.add(sibling)
+                    continue
+                if parts[0] in project and parts[0] not in modules:
+                    unresolved = True
+                # the module itself and its parent packages, whose __init__ runs on import
+                for i in range(1, len(parts) + 1):
+                    target = modules.get(".".join(parts[:i]))
+                    if target and target != path:
+                        targets.add(target)
+            self._imports[path] = (signature, sorted(targets), unresolved)
+        for path in [p for p in self._imports if p not in signatures]:
+            del self._imports[path]
+        return signatures
+
+    def _conftests(self, test: str, signatures: dict) -> list:
+        """The conftest.py files pytest loads for a test file: in its directory and above."""
+        found = []
+        directory = os.path.dirname(test)
+        while directory == self._root or directory.startswith(self._root + os.sep):
+            conftest = os.path.join(directory, "conftest.py")
+            if conftest in signatures:
+                found.append(conftest)
+            if directory == self._root:
+                break
+            directory = os.path.dirname(directory)
+        return found
+
+    def _closure(self, path: str) -> set:
+        seen = {path}
+        frontier = [path]
+        while frontier:
+            for target in self._imports.get(frontier.pop(), (None, (), False))[1]:
+                if target not in seen:
+                    seen.add(target)
+                    frontier.append(target)
+        return seen
+
+    def select(self, root: str, run_all: bool = False) -> tuple:
+        """Return (selected test files, changed files, snapshot) for a run starting now.
+
+        The snapshot maps every test file to the signatures of its
+        dependencies; pass it to ``finish`` once the run is over.
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            signatures = self._scan(root)
+            snapshot = {}
+            unresolved = set()
+            for test in sorted(p for p in signatures if is_test_file(p)):
+                dependencies = self._closure(test)
+                for conftest in self._conftests(test, signatures):
+                    dependencies |= self._closure(conftest)
+                snapshot[test] = {dep: signatures[dep] for dep in dependencies}
+                if any(self._imports[dep][2] for dep in dependencies if dep in self._imports):
+                    unresolved.add(test)
+            selected, changed = [], set()
+            for test, dependencies in snapshot.items():
+                previous = self._ran.get(test)
+                if previous is None or run_all or test in self._failing or test in unresolved:
+                    selected.append(test)
+                    continue
+                differing = {dep for dep, sig in dependencies.items() if previous.get(dep) != sig}
+                if differing:
+                    selected.append(test)
+                    changed |= differing
+            return selected, sorted(changed), snapshot
+
+    def finish(self, snapshot: dict, ran_files: list, failing_files: set):
+        """Remember the dependency state the given test files ran against and which still fail."""
+        with self._lock:
+            for test in ran_files:
+                if test in snapshot:
+                    self._ran[test] = snapshot[test]
+            self._failing = (self._failing - set(ran_files)) | set(failing_files)
+
+
+def run_test_worker(
+    targets: list,
+    registry: ProcessRegistry,
+    limits: SandboxLimits,
+    timeout: float,
+    cwd: str,
+    framework: str = "auto",
+) -> dict:
+    """Run the tests in a sandboxed worker and return its report.
+
+    Raises RuntimeError with the tail of the worker output when it died
+    before writing a report, and subprocess.TimeoutExpired on timeout.
+    """
+    fd, report_path = tempfile.mkstemp(dir=cache_dir("tests"), suffix=".json")
+    os.close(fd)
+    options = {"framework": framework, "targets": targets, "report": report_path}
+    try:
+        result = run_sandboxed(
+            [sys.executable, _WORKER, json.dumps(options)], registry, limits, timeout, cwd=cwd
+        )
+        try:
+            with open(report_path) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            output = (result.stdout + result.stderr).strip()[-2000:]
+            raise RuntimeError(
+                f"the test worker exited with code {result.returncode} before reporting:\n{output}"
+            )
+    finally:
+        os.unlink(report_path)
+    report["usage"] = result.usage_summary()
+    return report
+
+
+def record_file(record_id: str, root: str) -> str | None:
+    """Map a pytest node id or unittest test id back to its test file."""
+    if "::" in record_id or record_id.endswith(".py"):
+        return os.path.join(root, record_id.split("::")[0])
+    parts = record_id.split(".")
+    for i in range(len(parts), 0, -1):
+        path = os.path.join(root, *parts[:i]) + ".py"
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def format_report(report: dict, max_failures: int = 20) -> str:
+    """Render a worker report as a summary line plus the failures with their short tracebacks."""
+    records = report["records"]
+    counts = {}
+    for record in records:
+        counts[record["outcome"]] = counts.get(record["outcome"], 0) + 1
+    summary = ", ".join(
+        f"{counts.get(outcome, 0)} {outcome}" for outcome in ("passed", "failed", "error", "skipped")
+    )
+    lines = [f"{report['framework']} · {len(records)} results in {report['duration']:.2f}s: {summary}"]
+
+    if not records:
+        lines.append("No tests were collected.")
+
+    failures = [r for r in records if r["outcome"] in ("failed", "error")]
+    for record in failures[:max_failures]:
+        label = "FAILED" if record["outcome"] == "failed" else "ERROR"
+        lines.append(f"\n{label} {record['id']} ({record['duration']:.2f}s)")
+        if record["message"]:
+            lines.extend(f"  {line}" for line in record["message"].splitlines())
+    if len(failures) > max_failures:
+        lines.append(f"\n[... {len(failures) - max_failures} more failures not shown ...]")
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+"""Test worker: runs pytest (or unittest) in this process and writes JSON records.
+
+Usage: python testing_worker.py '<json options>'
+
+Options: framework ("auto", "pytest" or "unittest"), targets (test file
+paths, empty for discovery), report (path of the JSON report) and
+traceback_lines. Kept free of app imports, it runs with the workspace as cwd.
+"""
+
+import json
+import os
+import sys
+import time
+import unittest
+
+
+def _short(text: str, lines: int) -> str:
+    text_lines = text.rstrip().splitlines()
+    if len(text_lines) <= lines:
+        return "\n".join(text_lines)
+    return "\n".join(["...", *text_lines[-lines:]])
+
+
+def run_pytest(targets: list, traceback_lines: int) -> list:
+    import pytest
+
+    records = []
+
+    class Recorder:
+        def pytest_collectreport(self, report):
+            if report.failed:
+                records.append(
+                    {
+                        "id": report.nodeid or "collection",
+                        "outcome": "error",
+                        "duration": 0.0,
+                        "message": _short(report.longreprtext, traceback_lines),
+                    }
+                )
+
+        def pytest_runtest_logreport(self, report):
+            if report.when == "call" or report.outcome != "passed":
+                outcome = report.outcome
+                if report.when != "call" and report.failed:
+                    outcome = "error"  # setup or teardown failure
+                records.append(
+                    {
+                        "id": report.nodeid,
+                        "outcome": outcome,
+                        "duration": report.duration,
+                        "message": _short(report.longreprtext, traceback_lines)
+                        if report.outcome != "passed"
+                        else "",
+                    }
+                )
+
+    # like `python -m pytest`, so tests can import the workspace's packages
+    sys.path.insert(0, os.getcwd())
+    args = ["-q", "-p", "no:cacheprovider", "--tb=short", "-o", "console_output_style=classic"]
+    pytest.main(args + list(targets), plugins=[Recorder()])
+    return records
+
+
+class _RecordingResult(unittest.TestResult):
+    def __init__(self, traceback_lines: int):
+        super().__init__()
+        self.traceback_lines = traceback_lines
+        self.records = []
+        self._started = {}
+
+    def startTest(self, test):
+        super().startTest(test)
+        self._started[test.id()] = time.perf_counter()
+
+    def _record(self, test, outcome, err=None, message=""):
+        if err is not None:
+            # drops the unittest frames, like the text runner
+            message = self._exc_info_to_string(err, test)
+        started = self._started.pop(test.id(), time.perf_counter())
+        self.records.append(
+            {
+                "id": test.id(),
+                "outcome": outcome,
+                "duration": time.perf_counter() - started,
+                "message": _short(message, self.traceback_lines),
+            }
+        )
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, "passed")
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, "failed", err)
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._record(test, "error", err)
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, "skipped", message=reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, "passed")
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, "failed", message="unexpected success")
+
+
+def run_unittest(targets: list, traceback_lines: int) -> list:
+    sys.path.insert(0, os.getcwd())
+    loader = unittest.TestLoader()
+    if targets:
+        names = [os.path.splitext(os.path.normpath(t))[0].replace(os.sep, ".") for t in targets]
+        suite = loader.loadTestsFromNames(names)
+    else:
+        suite = loader.discover(".")
+    result = _RecordingResult(traceback_lines)
+    suite.run(result)
+    return result.records
+
+
+def main():
+    options = json.loads(sys.argv[1])
+    framework = options.get("framework", "auto")
+    if framework == "auto":
+        try:
+            import pytest  # noqa: F401
+
+            framework = "pytest"
+        except ImportError:
+            framework = "unittest"
+
+    started = time.perf_counter()
+    runner = run_pytest if framework == "pytest" else run_unittest
+    records = runner(options.get("targets", []), options.get("traceback_lines", 15))
+    with open(options["report"], "w") as f:
+        json.dump(
+            {
+                "framework": framework,
+                "duration": time.perf_counter() - started,
+                "records": records,
+            },
+            f,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+
+# arguments that name files whose state decides whether a repeat is a duplicate
+_PATH_ARGS = ("file_path", "path", "paths")
+
+
+def _normalize(name: str, value, resolve):
+    if isinstance(value, str):
+        value = value.strip()
+        return os.path.normpath(resolve(value)) if name in _PATH_ARGS and value else value
+    if isinstance(value, list) and name in _PATH_ARGS:
+        return [_normalize(name, item, resolve) for item in value]
+    return value
+
+
+def _tree_state(root: str) -> str:
+    """Digest of the mtimes of every directory below root: they change with any entry."""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames.sort()
+        try:
+            digest.update(f"{dirpath}\0{os.stat(dirpath).st_mtime_ns}\n".encode())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def _glob_state(pattern: str) -> str:
+    """Digest of the files a pattern matches, with their mtimes and sizes."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        try:
+            st = os.stat(path)
+            digest.update(f"{path}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def _file_state(args: dict) -> list:
+    state = []
+    for name in _PATH_ARGS:
+        paths = args.get(name)
+        for path in paths if isinstance(paths, list) else [paths]:
+            if not isinstance(path, str):
+                continue
+            if glob.has_magic(path):
+                state.append((path, _glob_state(path)))
+                continue
+            try:
+                st = os.stat(path)
+                # a listing depends on what is inside the directory, not on the directory
+                tree = _tree_state(path) if os.path.isdir(path) else None
+                state.append((path, st.st_mtime_ns, st.st_size, tree))
+            except OSError:
+                state.append((path, None, None, None))
+    return state
+
+
+# usage and timing figures differ between otherwise identical runs
+_VOLATILE_RE = re.compile(r"^(Resources|Kernel): .*$|\d+\.\d+ ?m?s\b", re.MULTILINE)
+
+
+def _describe(tool: str, args: dict) -> str:
+    text = ", ".join(f"{k}={json.dumps(v)}" for k, v in sorted(args.items()))
+    return f"{tool}({text[:80]}{'...' if len(text) > 80 else ''})"
+
+
+class _Turn:
+    def __init__(self):
+        self.calls = 0
+        self.generation = 0  # bumped by every call with side effects, and by polling
+        self.results = {}  # lookup key -> (call number, content, is_error)
+        self.history = []  # (signature, description) per call, duplicates included
+        self.stopped = None
+
+
+class ToolCallLedger:
+    """Remembers the tool calls of the current turn, per thread, to catch loops.
+
+    A call is a duplicate when the same tool ran with the same normalized
+    arguments, on files in the same state and with no call with side effects
+    in between. Duplicates of read-only calls, and of calls that failed, are
+    answered from the ledger instead of running again. Independently, a run of
+    calls (up to ``max_period`` long) that keeps coming back with identical
+    results ``max_repeats`` more times stops the turn with a diagnostic.
+    Calls to ``polling`` tools (job status and logs) are expected to repeat
+    while something runs in the background and take part in neither; as the
+    background may have changed anything, they also count as side effects.
+    While ``busy()`` (a background job is running), failed calls with side
+    effects always run again.
+    """
+
+    def __init__(
+        self,
+        read_only: set,
+        max_repeats: int = 3,
+        max_period: int = 3,
+        polling: set = frozenset(),
+        busy=lambda: False,
+    ):
+        self.read_only = read_only
+        self.polling = polling
+        self.busy = busy
+        self.max_repeats = max_repeats
+        self.max_period = max_period
+        self._lock = threading.Lock()
+        self._turns = {}
+
+    def begin_turn(self, thread_id: str):
+        """Start over for a new user request; repeating an earlier turn's call is fine."""
+        with self._lock:
+            self._turns[thread_id] = _Turn()
+
+    def forget_thread(self, thread_id: str):
+        with self._lock:
+            self._turns.pop(thread_id, None)
+
+    def _turn(self, thread_id: str) -> _Turn:
+        return self._turns.setdefault(thread_id, _Turn())
+
+    def _key(self, turn: _Turn, tool: str, args: dict, resolve) -> str:
+        args = {name: _normalize(name, value, resolve) for name, value in args.items()}
+        payload = json.dumps(
+            [tool, args, _file_state(args), turn.generation], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(
+        self, thread_id: str, tool: str, args: dict, resolve=os.path.abspath
+    ) -> str | None:
+        """Return the short-circuit answer for a duplicate call, or None to run it.
+
+        ``resolve`` maps path arguments to the files the tool really reads, for
+        the thread's workspace.
+        """
+        if tool in self.polling:
+            return None
+        with self._lock:
+            turn = self._turn(thread_id)
+            previous = turn.results.get(self._key(turn, tool, args, resolve))
+            if previous is None:
+                return None
+            number, content, is_error = previous
+            if tool not in self.read_only and (not is_error or self.busy()):
+                # re-running a successful command can be on purpose, and a failed
+                # one can succeed once a background job got further
+                return None
+            turn.calls += 1
+            ago = turn.calls - number
+            self._remember(turn, tool, args, content)
+
+        excerpt = content if len(content) <= 400 else content[:400] + "\n[...]"
+        if is_error:
+            return (
+                f"Error: same as call #{number} ({ago} calls ago), which failed with:\n{excerpt}\n"
+                "Nothing changed since, so it was not run again. Try a different approach."
+            )
+        return (
+            f"Same as call #{number} ({ago} calls ago); nothing changed since, "
+            f"so the result is identical:\n{excerpt}"
+        )
+
+    def record(
+        self,
+        thread_id: str,
+        tool: str,
+        args: dict,
+        content: str,
+        is_error: bool,
+        resolve=os.path.abspath,
+    ):
+        """Remember a call that ran and its result."""
+        with self._lock:
+            turn = self._turn(thread_id)
+            turn.calls += 1
+            if tool not in self.read_only or tool in self.polling:
+                turn.generation += 1
+            if tool in self.polling:
+                return
+            # keyed after the call's own effects, so an immediate repeat matches
+            turn.results[self._key(turn, tool, args, resolve)] = (turn.calls, content, is_error)
+            self._remember(turn, tool, args, content)
+
+    def _remember(self, turn: _Turn, tool: str, args: dict, content: str):
+        signature = hashlib.sha256(
+            json.dumps(
+                [tool, args, _VOLATILE_RE.sub("#", content)], sort_keys=True, default=str
+            ).encode()
+        ).hexdigest()
+        turn.history.append((signature, _describe(tool, args)))
+        del turn.history[: -(self.max_period * (self.max_repeats + 1))]
+        if turn.stopped is None and self.max_repeats:
+            turn.stopped = self._cycle(turn.history)
+
+    def _cycle(self, history: list) -> str | None:
+        signatures = [signature for signature, _ in history]
+        for period in range(1, self.max_period + 1):
+            needed = period * (self.max_repeats + 1)
+            if len(signatures) < needed:
+                break
+            window = signatures[-needed:]
+            if all(window[i] == window[i % period] for i in range(needed)):
+                calls = " → ".join(description for _, description in history[-period:])
+                return (
+                    f"Stopped: the same {'call' if period == 1 else f'{period} calls'} "
+                    f"ran {self.max_repeats + 1} times in a row with identical results:\n"
+                    f"  {calls}\n"
+                    "The model is looping without making progress. Check the last tool "
+                    "results, then give more specific instructions or fix the blocker."
+                )
+        return None
+
+    def stopped(self, thread_id: str) -> str | None:
+        """Return the diagnostic once a loop was detected in this turn, else None."""
+        with self._lock:
+            turn = self._turns.get(thread_id)
+            return turn.stopped if turn else None
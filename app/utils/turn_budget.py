@@ -0,0 +1,59 @@
+import time
+from app.utils.spill_store import estimate_tokens
+
+
+class TurnBudget:
+    """Wall-clock and token budget for one user turn, with progress counters."""
+
+    def __init__(self, max_seconds: float = 600, max_tokens: int = 250_000):
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.start()
+
+    def start(self):
+        """Begin a fresh budget, e.g. for a new turn, a resumed one or a new thread."""
+        self.started = time.monotonic()
+        self.tokens = 0
+        self.llm_steps = 0
+        self.tool_calls = 0
+        # prompt size of the turn's previous LLM call, which every call re-sends;
+        # the turn's first call pays for its whole prompt
+        self.last_input_tokens = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def record_llm(self, message):
+        """Count an AI message, preferring provider usage over an estimate.
+
+        Only what is new counts: the output plus the growth of the prompt
+        since the previous call. The history every call re-sends would
+        otherwise be counted again on each step.
+        """
+        self.llm_steps += 1
+        usage = getattr(message, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            input_tokens = usage.get("input_tokens", 0)
+            new_input = max(0, input_tokens - self.last_input_tokens)
+            self.last_input_tokens = input_tokens
+            self.tokens += new_input + usage.get("output_tokens", 0)
+        else:
+            self.tokens += estimate_tokens(str(message.content) + str(message.tool_calls))
+
+    def record_tools(self, count: int):
+        self.tool_calls += count
+
+    def exhausted(self) -> str | None:
+        """Return why the budget ran out, or None while there is budget left."""
+        if self.max_seconds and self.elapsed >= self.max_seconds:
+            return f"time budget of {self.max_seconds:.0f}s reached"
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            return f"token budget of {self.max_tokens:,} reached"
+        return None
+
+    def progress(self) -> str:
+        return (
+            f"{self.llm_steps} LLM step(s) · {self.tool_calls} tool call(s) · "
+            f"{self.elapsed:.0f}s · {self.tokens / 1000:.1f}k tokens"
+        )
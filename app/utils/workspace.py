@@ -0,0 +1,337 @@
+import filecmp
+import os
+import re
+import shutil
+import subprocess
+import threading
+import uuid
+from app.utils.cache import cache_dir
+from app.utils.files import IGNORED_DIRS, reflink
+
+
+# tool folders that only hold caches and build output: each overlay starts them empty
+_REGENERATED_DIRS = {"__pycache__", ".pytest_cache", ".mypy_cache", ".ruff_cache", "dist", "build"}
+
+
+def _inside(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _stat(path: str) -> tuple | None:
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _same_content(a: str, b: str) -> bool:
+    if os.path.islink(a) or os.path.islink(b):
+        return os.path.islink(a) and os.path.islink(b) and os.readlink(a) == os.readlink(b)
+    try:
+        return filecmp.cmp(a, b, shallow=False)
+    except OSError:
+        return False
+
+
+def _clone(src: str, dst: str):
+    """Make dst a separate copy of src: a reflink where supported, else a full copy."""
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+    elif reflink(src, dst):
+        shutil.copystat(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def _replace_with_copy(src: str, dst: str):
+    """Atomically make dst a separate copy of src (a symlink stays a symlink)."""
+    directory = os.path.dirname(dst)
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".projectx-{uuid.uuid4().hex[:12]}")
+    _clone(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _relocate_venv(source: str, target: str):
+    """Point a copied virtualenv's scripts at the copy, so pip installs into it."""
+    old, new = source.encode(), target.encode()
+    for name in ("bin", "Scripts"):
+        scripts = os.path.join(target, name)
+        if not os.path.isdir(scripts):
+            continue
+        for entry in os.scandir(scripts):
+            if not entry.is_file(follow_symlinks=False) or entry.stat().st_size > 1 << 20:
+                continue
+            with open(entry.path, "rb") as f:
+                content = f.read()
+            if old in content:
+                with open(entry.path, "wb") as f:
+                    f.write(content.replace(old, new))
+
+
+class Workspace:
+    """The tree a thread's tools read and write, and where its commands run.
+
+    Without an overlay this is the shared base tree. With one, the base is
+    copied on first use, as reflinks where the filesystem supports them, so
+    neither the write tools nor commands editing files in place reach the
+    base until ``merge``. The top-level repository gets its own git worktree
+    (detached at HEAD, sharing the object store and refs); other tool
+    folders are copied too, virtualenvs relocated, except caches and build
+    output, which start empty. None of them is part of the changes. Paths
+    under the base map to the overlay, relative paths resolve against ``root``.
+    """
+
+    def __init__(self, base: str, overlay: str | None = None):
+        self.base = os.path.abspath(base)
+        self.overlay = overlay
+        self._lock = threading.Lock()
+        # rel path -> (stat of the base file, stat of its copy) when copied
+        self._snapshot = None
+        self._untracked = set()  # rel paths of the tool folders, left out of the changes
+        self._worktree = False
+
+    @property
+    def root(self) -> str:
+        if self.overlay is None:
+            return self.base
+        self._ensure()
+        return self.overlay
+
+    def _git(self, *args, cwd: str | None = None) -> bool:
+        try:
+            result = subprocess.run(
+                ["git", *args], cwd=cwd or self.base, capture_output=True, timeout=120
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return result.returncode == 0
+
+    def _add_worktree(self) -> bool:
+        """Check out a worktree of the base repository at the overlay, without files."""
+        if not os.path.lexists(os.path.join(self.base, ".git")):
+            return False
+        if not self._git("worktree", "add", "--detach", "--no-checkout", self.overlay, "HEAD"):
+            return False
+        # fill its index from HEAD, so the copied files show the base's uncommitted edits
+        self._git("reset", "--quiet", cwd=self.overlay)
+        return True
+
+    def _ensure(self):
+        with self._lock:
+            if self._snapshot is not None:
+                return
+            self._worktree = self._add_worktree()
+            snapshot, untracked = {}, set()
+            if self._worktree:
+                untracked.add(".git")
+            for dirpath, dirnames, filenames in os.walk(self.base):
+                rel_dir = os.path.relpath(dirpath, self.base)
+                target_dir = os.path.normpath(os.path.join(self.overlay, rel_dir))
+                os.makedirs(target_dir, exist_ok=True)
+                if rel_dir == "." and self._worktree:
+                    # the worktree has its own .git, pointing into the base repository
+                    dirnames[:] = [d for d in dirnames if d != ".git"]
+                    filenames = [f for f in filenames if f != ".git"]
+                # symlinked directories are not walked into, they are copied like files
+                links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+                tool_dirs = [
+                    d
+                    for d in dirnames
+                    if d not in links and (d in IGNORED_DIRS or d.endswith(".egg-info"))
+                ]
+                dirnames[:] = [d for d in dirnames if d not in links and d not in tool_dirs]
+                for name in tool_dirs:
+                    source = os.path.join(dirpath, name)
+                    target = os.path.join(target_dir, name)
+                    if name in _REGENERATED_DIRS:
+                        os.makedirs(target, exist_ok=True)
+                    else:
+                        shutil.copytree(source, target, symlinks=True, copy_function=_clone)
+                        if os.path.isfile(os.path.join(source, "pyvenv.cfg")):
+                            _relocate_venv(source, target)
+                    untracked.add(os.path.normpath(os.path.join(rel_dir, name)))
+                for name in filenames + links:
+                    source = os.path.join(dirpath, name)
+                    target = os.path.join(target_dir, name)
+                    _clone(source, target)
+                    rel = os.path.normpath(os.path.join(rel_dir, name))
+                    snapshot[rel] = (_stat(source), _stat(target))
+            self._snapshot, self._untracked = snapshot, untracked
+
+    def resolve(self, path: str) -> str:
+        """Map a path given to a tool onto this workspace."""
+        path = os.path.expanduser(path)
+        if not os.path.isabs(path):
+            return os.path.normpath(os.path.join(self.root, path))
+        path = os.path.normpath(path)
+        if self.overlay and (path == self.base or path.startswith(self.base + os.sep)):
+            return os.path.normpath(os.path.join(self.root, os.path.relpath(path, self.base)))
+        return path
+
+    def display(self, path: str) -> str:
+        """The path the model should see: overlay paths are shown as their base equivalent."""
+        path = os.path.abspath(path)
+        if self.overlay and (path == self.overlay or path.startswith(self.overlay + os.sep)):
+            return os.path.normpath(os.path.join(self.base, os.path.relpath(path, self.overlay)))
+        return path
+
+    def changes(self) -> dict:
+        """Return {"added", "modified", "deleted"}: sorted relative paths that differ from the base."""
+        changes = {"added": [], "modified": [], "deleted": []}
+        if self.overlay is None or self._snapshot is None:
+            return changes
+        seen = set()
+        for dirpath, dirnames, filenames in os.walk(self.overlay):
+            rel_dir = os.path.relpath(dirpath, self.overlay)
+            dirnames[:] = [
+                d for d in dirnames if os.path.normpath(os.path.join(rel_dir, d)) not in self._untracked
+            ]
+            links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+            dirnames[:] = [d for d in dirnames if d not in links]
+            for name in filenames + links:
+                if name.startswith(".projectx-"):
+                    continue  # an atomic write in progress
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.overlay)
+                if rel in self._untracked:
+                    continue
+                seen.add(rel)
+                copied = self._snapshot.get(rel)
+                if copied is None:
+                    changes["added"].append(rel)
+                elif _stat(path) != copied[1] and not _same_content(
+                    path, os.path.join(self.base, rel)
+                ):
+                    changes["modified"].append(rel)
+        changes["deleted"] = [rel for rel in self._snapshot if rel not in seen]
+        for kind in changes:
+            changes[kind].sort()
+        return changes
+
+    def _prune_dirs(self, directory: str):
+        """Remove the base directories a merge emptied, unless the overlay still has them."""
+        while directory != self.base and _inside(directory, self.base):
+            if os.path.isdir(os.path.join(self.overlay, os.path.relpath(directory, self.base))):
+                return
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return  # not empty
+            directory = os.path.dirname(directory)
+
+    def merge(self, force: bool = False) -> tuple:
+        """Apply the overlay's changes to the base. Returns (merged, conflicts).
+
+        A change conflicts when the base file changed since the overlay
+        copied it (or, for an added file, appeared meanwhile); conflicts are
+        left alone unless ``force``. Directories left empty by deletions are
+        removed. The overlay stays usable.
+        """
+        if self.overlay is None:
+            return [], []
+        changes = self.changes()
+        merged, conflicts = [], []
+        with self._lock:
+            for kind in ("added", "modified", "deleted"):
+                for rel in changes[kind]:
+                    source = os.path.join(self.overlay, rel)
+                    target = os.path.join(self.base, rel)
+                    current = _stat(target)
+                    if not force and current != (self._snapshot.get(rel) or (None,))[0]:
+                        conflicts.append(rel)
+                        continue
+                    if kind == "deleted":
+                        if current is not None:
+                            os.unlink(target)
+                            self._prune_dirs(os.path.dirname(target))
+                        self._snapshot.pop(rel, None)
+                    else:
+                        _replace_with_copy(source, target)
+                        self._snapshot[rel] = (_stat(target), _stat(source))
+                    merged.append(rel)
+        return merged, conflicts
+
+    def discard(self):
+        """Drop the overlay and everything written to it; it is rebuilt on next use."""
+        if self.overlay is None:
+            return
+        with self._lock:
+            shutil.rmtree(self.overlay, ignore_errors=True)
+            if self._worktree:
+                self._git("worktree", "prune")
+                self._worktree = False
+            self._snapshot = None
+
+
+class WorkspaceManager:
+    """Hands each thread its Workspace: the shared tree, or its own overlay of it.
+
+    Overlays live next to the base, on the same filesystem so their copies
+    can be reflinks, and fall back to the cache dir where that is not writable.
+    """
+
+    def __init__(self):
+        self.base = None
+        self.isolated = False
+        self._lock = threading.Lock()
+        self._session = uuid.uuid4().hex[:8]
+        self._workspaces = {}
+
+    def configure(self, base: str | None = None, isolated: bool = False):
+        with self._lock:
+            base = os.path.abspath(base or os.getcwd())
+            if (base, isolated) != (self.base, self.isolated):
+                self.base, self.isolated = base, isolated
+                self._workspaces = {}
+
+    def _overlay_dir(self, thread_id: str) -> str:
+        name = f"{self._session}-{re.sub(r'[^A-Za-z0-9_-]', '_', thread_id)[:40]}"
+        parent = os.path.join(
+            os.path.dirname(self.base), f".{os.path.basename(self.base)}-overlays"
+        )
+        try:
+            if _inside(parent, self.base):
+                raise OSError  # the base is /
+            os.makedirs(parent, exist_ok=True)
+        except OSError:
+            parent = cache_dir("overlays")
+        # building the farm would walk into the overlay it is building
+        if _inside(os.path.realpath(parent), os.path.realpath(self.base)):
+            raise ValueError(
+                f"Cannot isolate {self.base}: the overlay directory {parent} is inside it. "
+                "Set PROJECTX_CACHE_DIR to a directory outside the workspace."
+            )
+        return os.path.join(parent, name)
+
+    def get(self, config=None) -> Workspace:
+        """Return the workspace for the thread in a runnable config."""
+        thread_id = (config or {}).get("configurable", {}).get("thread_id") or "default"
+        with self._lock:
+            if self.base is None:
+                self.base = os.getcwd()
+            key = thread_id if self.isolated else None
+            workspace = self._workspaces.get(key)
+            if workspace is None:
+                overlay = self._overlay_dir(thread_id) if self.isolated else None
+                workspace = self._workspaces[key] = Workspace(self.base, overlay)
+            return workspace
+
+    def discard(self, thread_id: str):
+        with self._lock:
+            workspace = self._workspaces.pop(thread_id, None) if self.isolated else None
+        if workspace is not None:
+            workspace.discard()
+
+    def cleanup(self) -> list:
+        """Remove the overlays without changes. Returns the paths of those kept."""
+        with self._lock:
+            workspaces = [w for w in self._workspaces.values() if w.overlay]
+        kept = []
+        for workspace in workspaces:
+            if any(workspace.changes().values()):
+                kept.append(workspace.overlay)
+            else:
+                workspace.discard()
+        return kept
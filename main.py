@@ -6,7 +6,16 @@ from app import Agent
 load_dotenv()
 
 API_KEY = os.getenv("API_KEY")
-MODEL_NAME = "llama-3.3-70b"
+MODEL_NAME = os.getenv("MODEL_NAME", "llama-3.3-70b")
+# optional cheaper model for routine steps after successful tool calls
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME")
+# duplicate requests that are slow to start, optionally to a backup model
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "").lower() in ("1", "true", "yes")
+HEDGE_MODEL_NAME = os.getenv("HEDGE_MODEL_NAME")
+# the project the agent works on, summarized in the system prompt (default: cwd)
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT")
+# give each conversation its own copy-on-write overlay, applied with /merge
+ISOLATED_WORKSPACE = os.getenv("ISOLATED_WORKSPACE", "").lower() in ("1", "true", "yes")
 
 # system_prompt = textwrap.dedent(input().strip())
 
@@ -20,7 +29,12 @@ with open(system_prompt_path, "r") as file:
 agent = Agent(
     model_name=MODEL_NAME,
     api_key=API_KEY,
-    system_prompt=system_prompt
+    system_prompt=system_prompt,
+    model_tiers={"fast": FAST_MODEL_NAME} if FAST_MODEL_NAME else None,
+    hedge_requests=HEDGE_REQUESTS,
+    hedge_model=HEDGE_MODEL_NAME,
+    workspace_root=WORKSPACE_ROOT,
+    isolated_workspace=ISOLATED_WORKSPACE,
 )
 
 agent.start_chat()
\ No newline at end of file